@@ -0,0 +1,352 @@
+"""monitor.py 的性能基准测试: 启动一个模拟大量监控目标的本地 HTTP 服务器, 生成 config.yml 与临时快照目录,
+在独立子进程中运行 monitor.main(), 统计总耗时、每秒处理的目标数、峰值内存与差异计算耗时
+
+用法:
+    python benchmark.py                                    # 依次运行 10 / 1000 / 10000 个目标的场景
+    python benchmark.py --targets 10 1000 --output before.json
+    python benchmark.py --targets 10 1000 --baseline before.json --output after.json
+
+每个场景先在空快照目录中运行一次 (cold, 所有目标都是新目标), 然后服务器按 --change-probability
+让部分目标的内容发生变化, 在已有历史的快照目录中再运行一次 (warm, 需要读取历史并计算差异)。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# 子进程中写入的运行结果与指标文件名
+RESULT_FILE = "benchmark_result.json"
+METRICS_FILE = "metrics.jsonl"
+# 运行时不应继承的环境变量: 避免写入真实的 GitHub 输出或发送真实通知
+ISOLATED_ENV_VARS = ["GITHUB_OUTPUT", "GITHUB_STEP_SUMMARY", "GITHUB_REPOSITORY", "WEBHOOK_URL", "MAIL_RECIPIENTS", "SMTP_HOST"]
+# 与基线比较的指标: 数值是否越小越好, 以及视为噪声的最小绝对变化量 (避免毫秒级的波动被判为劣化);
+# 每秒目标数由总耗时换算而来, 只记录不单独比较
+COMPARED_METRICS = {
+    "wall_seconds": (True, 0.05),
+    "peak_rss_mb": (True, 1.0),
+    "diff_seconds": (True, 0.05),
+}
+# 生成内容中每一行 (或每个元素) 的大致字节数
+ROW_BYTES = 64
+# 每个新版本中内容发生变化的行数
+CHANGED_ROWS = 3
+
+
+def target_random(seed, index, salt):
+    """为目标生成确定性的随机数, 相同参数在任何机器上结果相同"""
+    return random.Random(f"{seed}:{index}:{salt}").random()
+
+
+def get_target_profile(options, index):
+    """目标的固定属性: 内容类型与 HTTP 状态码"""
+    kinds, weights = zip(*options["payload_mix"].items())
+    kind = random.Random(f"{options['seed']}:{index}:kind").choices(kinds, weights)[0]
+    status = 200
+    if target_random(options["seed"], index, "error") < options["error_rate"]:
+        status = 404 if index % 2 == 0 else 403
+    return kind, status
+
+
+def render_body(kind, index, version, size):
+    """生成目标某个版本的内容: 每个版本只有少数几行不同, 与真实页面的小幅更新类似"""
+    rows = max(1, size // ROW_BYTES)
+    changed = {(version * 7919 + k * 104729 + index) % rows for k in range(CHANGED_ROWS)} if version else set()
+    if kind == "json":
+        items = [{"id": j, "value": f"v{version}" if j in changed else "v0", "text": "lorem ipsum dolor sit amet"}
+                 for j in range(rows)]
+        return json.dumps({"target": index, "items": items}).encode("utf-8")
+    parts = [f'<div class="row" id="t{index}-{j}"><span>{f"v{version}" if j in changed else "v0"}</span> lorem ipsum</div>'
+             for j in range(rows)]
+    separator = "" if kind == "minified" else "\n"
+    return (f"<html><body>{separator}" + separator.join(parts) + f"{separator}</body></html>").encode("utf-8")
+
+
+class TargetState:
+    """各目标当前的内容版本: 每进入新的一轮, 每个目标以 change_probability 的概率产生新版本"""
+
+    def __init__(self, options, round_value):
+        self.options = options
+        self.round_value = round_value
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get_version(self, index):
+        current_round = self.round_value.value
+        with self.lock:
+            known_round, version = self.versions.get(index, (0, 0))
+            for k in range(known_round + 1, current_round + 1):
+                if target_random(self.options["seed"], index, f"round{k}") < self.options["change_probability"]:
+                    version = k
+            self.versions[index] = (current_round, version)
+            return version
+
+
+def serve_targets(options, round_value, port_queue):
+    """在子进程中运行模拟目标服务器, 路径 /t/<序号> 对应第几个目标"""
+    state = TargetState(options, round_value)
+
+    class TargetHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            try:
+                index = int(self.path.rsplit("/", 1)[1])
+            except (IndexError, ValueError):
+                index = -1
+            if options["latency"]:
+                time.sleep(options["latency"])
+            if index < 0:
+                self.send_error(400)
+                return
+            kind, status = get_target_profile(options, index)
+            if status != 200:
+                body = f"{status} error".encode("utf-8")
+            else:
+                body = render_body(kind, index, state.get_version(index), options["body_size"])
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json" if kind == "json" else "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_POST = do_GET
+
+        def log_message(self, format, *args):
+            pass
+
+    class TargetServer(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # 客户端关闭空闲的 keep-alive 连接时会出现连接重置, 不属于错误
+            if not isinstance(sys.exc_info()[1], ConnectionError):
+                super().handle_error(request, client_address)
+
+    server = TargetServer(("127.0.0.1", 0), TargetHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def build_config(options, count, port):
+    """生成基准测试使用的 config.yml 内容"""
+    targets = []
+    for index in range(count):
+        kind, _ = get_target_profile(options, index)
+        url = f"http://127.0.0.1:{port}/t/{index}"
+        if target_random(options["seed"], index, "curl") < options["curl_ratio"]:
+            target = {"type": "curl", "command": f"curl -s '{url}' -H 'Accept: */*'"}
+        else:
+            target = {"type": "url", "value": url}
+        if kind == "json":
+            target["format"] = "json"
+        targets.append(target)
+    settings = {
+        "retry_count": 1,
+        "retry_delay_seconds": 0,
+        "notify_http_status_codes": [404, 403],
+        "max_concurrency": options["concurrency"],
+        # 所有目标位于同一主机, 单主机并发数与全局并发数保持一致
+        "max_per_host": options["concurrency"],
+        "circuit_breaker": {"failure_threshold": 0},
+        "metrics": {"jsonl_file": METRICS_FILE, "step_summary": False},
+    }
+    return {"settings": settings, "targets": targets}
+
+
+def run_once(workdir):
+    """在子进程中执行一次 monitor.main(), 将耗时、峰值内存与各目标的指标写入结果文件"""
+    import resource
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    import monitor
+    monitor.SNAPSHOT_DIR = os.path.join(workdir, "snapshots")
+    if os.path.exists(METRICS_FILE):
+        os.remove(METRICS_FILE)
+    started = time.perf_counter()
+    monitor.main()
+    wall = time.perf_counter() - started
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上 ru_maxrss 的单位为 KB, macOS 上为字节
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    outcomes, diff_seconds = {}, 0.0
+    with open(METRICS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["type"] == "target":
+                outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+                diff_seconds += record.get("diff", 0.0)
+    with open(RESULT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"wall_seconds": wall, "peak_rss_mb": peak_rss_mb, "diff_seconds": diff_seconds, "outcomes": outcomes}, f)
+
+
+def run_monitor(workdir, phase):
+    """启动子进程运行 monitor.main(), 每次运行的峰值内存互不影响"""
+    env = {key: value for key, value in os.environ.items() if key not in ISOLATED_ENV_VARS}
+    result_path = os.path.join(workdir, RESULT_FILE)
+    if os.path.exists(result_path):
+        os.remove(result_path)
+    with open(os.path.join(workdir, f"{phase}.log"), "w", encoding="utf-8") as log:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--run-once", workdir],
+                       stdout=log, stderr=subprocess.STDOUT, env=env, check=True)
+    with open(result_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_scenario(options, count, port, round_value, keep_dir):
+    """运行一个场景: cold (空快照目录) 与 warm (已有历史, 部分目标内容变化) 各一次"""
+    workdir = tempfile.mkdtemp(prefix=f"webmonitor-bench-{count}-")
+    results = []
+    try:
+        with open(os.path.join(workdir, "config.yml"), "w", encoding="utf-8") as f:
+            yaml.safe_dump(build_config(options, count, port), f, allow_unicode=True, sort_keys=False)
+        for phase, server_round in (("cold", 0), ("warm", 1)):
+            round_value.value = server_round
+            if phase == "warm":
+                # 版本目录以秒为单位命名, 两次运行落在同一秒内时新版本会与上次的目录冲突
+                time.sleep(1 - time.time() % 1)
+            result = run_monitor(workdir, phase)
+            result.update({
+                "targets": count, "phase": phase,
+                "targets_per_second": count / result["wall_seconds"] if result["wall_seconds"] else 0.0,
+            })
+            results.append(result)
+            print_result(result)
+    finally:
+        if keep_dir:
+            print(f"快照目录已保留: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_result(result):
+    outcomes = ", ".join(f"{key} {value}" for key, value in sorted(result["outcomes"].items()))
+    print(f"{result['targets']:>6} 个目标  {result['phase']:<4}  总耗时 {result['wall_seconds']:8.2f} 秒  "
+          f"{result['targets_per_second']:8.1f} 目标/秒  峰值内存 {result['peak_rss_mb']:7.1f} MB  "
+          f"差异计算 {result['diff_seconds']:7.3f} 秒  ({outcomes})", flush=True)
+
+
+def get_commit():
+    """当前代码的 git 提交, 不在 git 仓库中时返回 None"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """与基线结果逐项比较, 返回劣化超过容差的指标数量"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    baseline_results = {(item["targets"], item["phase"]): item for item in baseline["results"]}
+    if baseline.get("options") and baseline["options"] != results["options"]:
+        print("::warning::基线使用的参数与本次不同，比较结果仅供参考。")
+    print(f"\n--- 与基线比较 ({baseline_path}, 提交 {baseline.get('commit') or '未知'}) ---")
+    regressions = 0
+    for item in results["results"]:
+        previous = baseline_results.get((item["targets"], item["phase"]))
+        if not previous:
+            continue
+        changes = []
+        for metric, (lower_is_better, noise) in COMPARED_METRICS.items():
+            old, new = previous[metric], item[metric]
+            if not old:
+                continue
+            delta = (new - old) / old
+            worse = (delta > tolerance if lower_is_better else delta < -tolerance) and abs(new - old) > noise
+            regressions += worse
+            changes.append(f"{metric} {old:.3f} -> {new:.3f} ({delta:+.1%}){' 劣化' if worse else ''}")
+        print(f"{item['targets']:>6} 个目标  {item['phase']:<4}  " + "; ".join(changes))
+    return regressions
+
+
+def parse_payload_mix(value):
+    """解析内容类型比例, 如 html=0.5,minified=0.2,json=0.3"""
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in ("html", "minified", "json"):
+            raise argparse.ArgumentTypeError(f"未知的内容类型: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="monitor.py 性能基准测试")
+    parser.add_argument("--targets", type=int, nargs="+", default=[10, 1000, 10000], help="各场景的目标数量 (默认 10 1000 10000)")
+    parser.add_argument("--body-size", type=int, default=20000, help="每个目标的响应体大小 (字节, 默认 20000)")
+    parser.add_argument("--latency", type=float, default=0.02, help="服务器每个请求的响应延迟 (秒, 默认 0.02)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="返回 404/403 的目标比例 (默认 0.05)")
+    parser.add_argument("--change-probability", type=float, default=0.1, help="warm 运行前每个目标内容变化的概率 (默认 0.1)")
+    parser.add_argument("--payload-mix", type=parse_payload_mix, default="html=0.5,minified=0.2,json=0.3", help="内容类型比例 (默认 html=0.5,minified=0.2,json=0.3)")
+    parser.add_argument("--curl-ratio", type=float, default=0.1, help="以 curl 命令配置的目标比例 (默认 0.1)")
+    parser.add_argument("--concurrency", type=int, default=8, help="monitor.py 的并发抓取数 (默认 8)")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子, 相同种子生成完全相同的目标 (默认 1)")
+    parser.add_argument("--output", default="benchmark_results.json", help="本次结果的保存路径 (默认 benchmark_results.json)")
+    parser.add_argument("--baseline", help="与之比较的基线结果文件; 存在劣化超过容差的指标时以退出码 1 结束")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="与基线比较时允许的劣化比例 (默认 0.1)")
+    parser.add_argument("--keep-dir", action="store_true", help="保留各场景的临时快照目录以便检查")
+    parser.add_argument("--run-once", metavar="WORKDIR", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_once:
+        run_once(args.run_once)
+        return
+    options = {
+        "body_size": args.body_size, "latency": args.latency, "error_rate": args.error_rate,
+        "change_probability": args.change_probability, "payload_mix": args.payload_mix,
+        "curl_ratio": args.curl_ratio, "concurrency": args.concurrency, "seed": args.seed,
+    }
+    round_value = multiprocessing.Value("i", 0)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_targets, args=(options, round_value, port_queue), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=30)
+    print(f"模拟目标服务器已启动: http://127.0.0.1:{port}/t/<序号>", flush=True)
+
+    results = []
+    try:
+        for count in args.targets:
+            results.extend(run_scenario(options, count, port, round_value, args.keep_dir))
+    finally:
+        server.terminate()
+        server.join()
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+    if args.baseline:
+        regressions = compare_with_baseline(report, args.baseline, args.tolerance)
+        if regressions:
+            print(f"::error::共有 {regressions} 项指标劣化超过 {args.tolerance:.0%}。")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,45 @@ import os
 import sys
 import hashlib
 import requests
-import difflib
+import urllib3
+import bisect
 import json
 import smtplib
 import ssl
 import yaml
 import subprocess
+import shlex
 import re
 import time
+import random
+import heapq
+import signal
+import threading
+import itertools
+import queue
+import http.cookiejar
+import tempfile
+import gzip
+import io
+import argparse
+import shutil
+import cProfile
+import pstats
+from contextlib import contextmanager
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timezone, timedelta
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote_plus
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import Header
 from email.utils import formataddr
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # --- 配置 ---
 SNAPSHOT_DIR = "snapshots"
 CONFIG_FILE = "config.yml"
@@ -26,8 +50,145 @@ HEADERS = {
 TIMEOUT = 30
 # 通知中显示的最大差异行数
 MAX_DIFF_LINES = 30
+# 差异报告中每个变更块前后保留的上下文行数
+DIFF_CONTEXT_LINES = 3
+# 单次差异计算的耗时预算 (秒), 超时后剩余部分按整段替换输出
+DIFF_TIME_BUDGET = 5.0
+# 无法通过唯一行锚定的区域使用 Myers 算法, 编辑距离超过该值时按整段替换输出
+DIFF_MAX_EDIT_DISTANCE = 1000
+# 平均行长超过该值时视为压缩/单行内容, 改为按标记 (token) 比较
+MINIFIED_LINE_LENGTH = 500
+# 结构化 JSON 差异中单个值的最大显示长度
+JSON_VALUE_DISPLAY_LENGTH = 200
 # 定义时区为 UTC+8
 CST_TZ = timezone(timedelta(hours=8))
+# 进程内执行 curl 目标时模拟的默认请求头
+CURL_DEFAULT_HEADERS = {"User-Agent": "curl/8.5.0", "Accept": "*/*", "Accept-Encoding": None}
+# 默认的全局并发抓取数与单个主机的并发抓取数
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_PER_HOST = 4
+# 守护进程模式下目标的默认轮询间隔 (秒), 以及检查配置文件是否修改的间隔 (秒)
+DEFAULT_INTERVAL_SECONDS = 900
+DAEMON_CONFIG_CHECK_SECONDS = 5
+# 失败重试的最长退避时间 (秒)
+RETRY_MAX_DELAY_SECONDS = 60
+# 由调度器负责重试的抓取异常
+RETRYABLE_FETCH_ERRORS = (requests.RequestException, subprocess.CalledProcessError, subprocess.TimeoutExpired)
+# 视为连接失败的 curl 退出码: 无法解析主机、无法连接、超时、TLS 握手失败、空响应、接收失败
+CURL_CONNECTION_EXIT_CODES = {6, 7, 28, 35, 52, 56}
+# 熔断器的默认参数: 同一主机连续连接失败的次数阈值 (0 为不启用) 与熔断的冷却时间 (秒)
+DEFAULT_CIRCUIT_BREAKER = {"failure_threshold": 3, "cooldown_seconds": 600}
+# Webhook 通知的并发数、尝试次数与重试的基础等待时间 (秒)
+WEBHOOK_MAX_CONCURRENCY = 8
+WEBHOOK_RETRY_COUNT = 3
+WEBHOOK_RETRY_DELAY_SECONDS = 2
+WEBHOOK_TIMEOUT = 10
+# SMTP 连接超时 (秒)
+SMTP_TIMEOUT = 30
+# 通知邮件的 HTML 模板: 每个变更一个区块, 拼接后填入整体模板
+EMAIL_CHANGE_BLOCK_TEMPLATE = """
+        <div class="change-block">
+            <p><strong>监控目标:</strong> {display_name}</p>
+            <p><strong>变更时间:</strong> {timestamp}</p>
+            <p><strong>查看快照:</strong> <a href="{snapshot_url}" class="link">在 GitHub 上查看</a></p>
+            <div class="diff-box">
+                <strong class="diff-title">变更内容:</strong>
+                {diff_html}
+            </div>
+        </div>
+        """
+EMAIL_HTML_TEMPLATE = """
+    <!DOCTYPE html><html lang="zh-CN"><head><meta charset="UTF-8"><title>{subject}</title><style>
+      body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; line-height: 1.6; color: #333333; background-color: #f7f8fa; margin: 0; padding: 0; }}
+      .container {{ max-width: 680px; margin: 20px auto; padding: 30px; border-radius: 8px; background-color: #ffffff; border: 1px solid #e9e9e9; }}
+      .header {{ font-size: 24px; font-weight: 600; color: #2c3e50; margin-bottom: 25px; padding-bottom: 20px; border-bottom: 1px solid #eeeeee; text-align: center; }}
+      .change-block {{ margin-bottom: 25px; padding: 20px; border-radius: 6px; border: 1px solid #dfe6e9; border-left: 4px solid #3498db; }}
+      .change-block p {{ margin: 0 0 8px; font-size: 14px; color: #555555; }}
+      .link {{ color: #3498db; text-decoration: none; }}.link:hover {{ text-decoration: underline; }}
+      .url-display {{ color: #7f8c8d; }}
+      .diff-box {{ background-color: #fdfdfd; padding: 15px; margin-top: 15px; border-radius: 5px; font-family: 'Courier New', Courier, monospace; font-size: 12px; line-height: 1.5; white-space: pre-wrap; word-wrap: break-word; border: 1px solid #f0f0f0; }}
+      .diff-title {{ font-family: -apple-system, sans-serif; display: block; margin-bottom: 10px; font-size: 13px; color: #333; font-weight: 600; }}
+      .footer {{ margin-top: 30px; font-size: 12px; text-align: center; color: #999999; }}
+    </style></head><body><div class="container"><div class="header">{subject}</div><div class="content">{content}</div><div class="footer"><p>此邮件由 GitHub Actions 自动发送。</p></div></div></body></html>
+    """
+# 跨运行保存的调度与熔断状态目录 (不提交到仓库, 在 GitHub Actions 中通过缓存保留)
+STATE_DIR = ".monitor_state"
+SCHEDULE_STATE_FILE = "schedule.json"
+BREAKER_STATE_FILE = "breakers.json"
+# 自适应轮询的默认参数
+DEFAULT_ADAPTIVE_POLLING = {
+    "enabled": False,
+    "min_interval_seconds": 900,
+    "max_interval_seconds": 86400,
+    "backoff_factor": 2.0,
+    "max_requests_per_run": 0,
+}
+# 定时运行的启动时间存在波动, 判断目标是否到期时允许的提前量 (秒)
+ADAPTIVE_SLACK_SECONDS = 60
+# 条件请求校验信息 (ETag / Last-Modified) 的保存文件名, 与 latest.hash 位于同一目录
+VALIDATORS_FILE = "validators.json"
+# 流式读取响应体时每次读取的块大小
+CHUNK_SIZE = 64 * 1024
+# 响应体超过该大小时才溢出到临时文件, 否则保存在内存中
+SPOOL_THRESHOLD = 1024 * 1024
+# 单个目标响应体的默认大小上限 (字节), 可通过 settings.max_bytes 或目标的 max_bytes 覆盖
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+# 内容寻址对象存储目录 (位于 SNAPSHOT_DIR 下), 以及每个版本目录中指向对象的元数据文件名
+OBJECTS_DIRNAME = "_objects"
+SNAPSHOT_META_FILE = "meta.json"
+# 旧版本直接保存在版本目录中的快照文件名
+LEGACY_SNAPSHOT_FILES = ["snapshot.html", "response.txt", "error.txt"]
+# 每个目标的版本索引文件 (JSON Lines, 只追加, 按时间戳排序)
+HISTORY_FILE = "history.jsonl"
+# 分片运行时结果包的描述文件名, 以及结果包中存放快照文件副本的目录名
+BUNDLE_FILE = "bundle.json"
+BUNDLE_SNAPSHOTS_DIRNAME = "snapshots"
+# 运行指标的默认导出配置: JSON Lines 文件、Prometheus 文本文件 (留空不导出)、GitHub 步骤摘要及其中列出的最慢目标数
+DEFAULT_METRICS = {"jsonl_file": "", "prometheus_file": "", "step_summary": True, "summary_top": 10}
+# 计入目标总耗时的阶段; connect 包含在 ttfb 中, hash 包含在 transfer 与 process 中
+TARGET_TOTAL_STAGES = ("ttfb", "transfer", "process", "diff", "persist")
+# 步骤摘要中各阶段的显示名称
+STAGE_LABELS = {
+    "connect": "连接", "ttfb": "首字节", "transfer": "传输", "hash": "哈希", "process": "处理",
+    "diff": "差异", "persist": "写入", "notify_webhook": "Webhook 通知", "notify_email": "邮件通知",
+    "check": "抓取与比对",
+}
+# --profile 输出中列出的函数数量
+PROFILE_TOP_FUNCTIONS = 30
+# 版本目录名使用的时间戳格式
+VERSION_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+_http_session = None
+_http_session_lock = threading.Lock()
+# 各目标最新哈希的内存缓存 (目标目录 -> 哈希), 常驻模式下避免反复读取 latest.hash
+_latest_hashes = {}
+# 当前线程正在记录耗时的目标 (阶段 -> 秒)
+_stage_timings = threading.local()
+
+def add_stage_time(stage, seconds):
+    """将耗时累加到当前线程正在记录的目标上, 没有正在记录的目标时忽略"""
+    timings = getattr(_stage_timings, "current", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def collect_stage_times(timings):
+    """在代码块执行期间, 将当前线程记录的各阶段耗时累加到 timings"""
+    previous = getattr(_stage_timings, "current", None)
+    _stage_timings.current = timings
+    try:
+        yield timings
+    finally:
+        _stage_timings.current = previous
+
+@contextmanager
+def timed_stage(stage):
+    """记录代码块的耗时到当前目标的指定阶段"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_stage_time(stage, time.perf_counter() - started)
 
 def get_safe_filename_from_url(url):
     """根据URL生成一个安全的文件名"""
@@ -44,6 +205,64 @@ def get_safe_filename_from_url(url):
         print(f"::warning::从 URL '{url}' 生成文件名失败: {e}")
         return None
 
+class ContentBody:
+    """抓取到的响应体: 边写入边计算 SHA-256, 超过阈值时溢出到临时文件, 仅在需要时才读取完整内容"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.truncated = False
+        self._hasher = hashlib.sha256()
+        self._spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD)
+
+    @classmethod
+    def from_bytes(cls, data, max_bytes=None):
+        body = cls(max_bytes)
+        body.write(data)
+        return body
+
+    def write(self, chunk):
+        """追加一块数据; 超过大小上限时截断并写入截断标记, 返回是否还可以继续写入"""
+        if self.truncated:
+            return False
+        if self.max_bytes is not None and self.size + len(chunk) > self.max_bytes:
+            self._append(chunk[:self.max_bytes - self.size])
+            self._append(f"\n... [内容已截断: 超过 max_bytes 上限 {self.max_bytes} 字节]".encode('utf-8'))
+            self.truncated = True
+            return False
+        self._append(chunk)
+        return True
+
+    def _append(self, chunk):
+        started = time.perf_counter()
+        self._hasher.update(chunk)
+        add_stage_time("hash", time.perf_counter() - started)
+        self._spool.write(chunk)
+        self.size += len(chunk)
+
+    @property
+    def hash(self):
+        return self._hasher.hexdigest()
+
+    def read(self):
+        """读取完整内容"""
+        self._spool.seek(0)
+        return self._spool.read()
+
+    def copy_to(self, f):
+        """将内容按块写入文件对象, 不在内存中拼接完整内容"""
+        self._spool.seek(0)
+        for chunk in iter(lambda: self._spool.read(CHUNK_SIZE), b""):
+            f.write(chunk)
+
+    def close(self):
+        self._spool.close()
+
+def get_max_bytes(target, settings):
+    """获取目标响应体的大小上限, 目标配置优先于全局配置; 配置为 0 或 null 表示不限制"""
+    max_bytes = target.get("max_bytes", settings.get("max_bytes", DEFAULT_MAX_BYTES))
+    return int(max_bytes) if max_bytes else None
+
 def extract_url_from_curl(command):
     """从 curl 命令中提取主要的目标 URL (通常是第一个)"""
     urls = re.findall(r'https?://[^\s\'"]+', command)
@@ -51,160 +270,1499 @@ def extract_url_from_curl(command):
         return urls[0]
     return None
 
-def fetch_content_from_url(url, retry_count, retry_delay, notify_status_codes=None):
-    """从 URL 获取内容, 包含重试机制"""
-    last_exception = None
-    last_status_code = None
-    for attempt in range(retry_count):
+class TimedConnectMixin:
+    """记录建立新连接 (DNS 解析、TCP 与 TLS 握手) 的耗时; 复用连接池中的连接时不计时"""
+
+    def connect(self):
+        started = time.perf_counter()
         try:
-            response = requests.get(url, headers=HEADERS, timeout=TIMEOUT)
-            last_status_code = response.status_code
-            if response.ok:
-                return response.content, False, None
+            super().connect()
+        finally:
+            add_stage_time("connect", time.perf_counter() - started)
+
+class TimedHTTPConnection(TimedConnectMixin, urllib3.connection.HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(TimedConnectMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """连接池中的连接在建立时记录连接耗时"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+def get_http_session(pool_maxsize=DEFAULT_MAX_PER_HOST):
+    """获取全局共享的 HTTP 会话, 按主机维护 keep-alive 连接池以复用 TCP/TLS 连接"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            # 不在目标之间共享服务器下发的 Cookie, 与独立请求及 curl 的行为保持一致
+            session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            adapter = TimedHTTPAdapter(pool_connections=16, pool_maxsize=max(1, pool_maxsize))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _http_session = session
+        return _http_session
+
+def load_validators(url_dir):
+    """读取目标上次成功响应的 ETag / Last-Modified; 没有可用的最新哈希时不发送条件请求"""
+    if not os.path.exists(os.path.join(url_dir, "latest.hash")):
+        return None
+    try:
+        with open(os.path.join(url_dir, VALIDATORS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f) or None
+    except (OSError, ValueError):
+        return None
+
+def save_validators(url_dir, validators):
+    """保存目标的 ETag / Last-Modified, 响应未提供时删除旧记录"""
+    validators_file = os.path.join(url_dir, VALIDATORS_FILE)
+    if not validators:
+        if os.path.exists(validators_file):
+            os.remove(validators_file)
+        return
+    if load_validators(url_dir) == validators:
+        return
+    with open(validators_file, "w", encoding="utf-8") as f:
+        json.dump(validators, f, ensure_ascii=False, sort_keys=True)
+
+def get_response_validators(response):
+    """从响应头中提取条件请求所需的校验信息"""
+    validators = {}
+    if response.headers.get("ETag"):
+        validators["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        validators["last_modified"] = response.headers["Last-Modified"]
+    return validators
+
+def read_response_body(response, url, max_bytes=None, translate_newlines=False):
+    """按块读取响应体并增量计算哈希; translate_newlines 时按文本模式将 CRLF/CR 转换为 LF"""
+    body = ContentBody(max_bytes)
+    pending_cr = False
+    started = time.perf_counter()
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if translate_newlines:
+                if pending_cr:
+                    chunk = b"\r" + chunk
+                pending_cr = chunk.endswith(b"\r")
+                if pending_cr:
+                    chunk = chunk[:-1]
+                chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            if not body.write(chunk):
+                print(f"::warning::'{url}' 的响应体超过 {max_bytes} 字节，已截断。")
+                break
+        else:
+            if pending_cr:
+                body.write(b"\n")
+    except BaseException:
+        body.close()
+        raise
+    finally:
+        add_stage_time("transfer", time.perf_counter() - started)
+    return body
+
+def fetch_content_from_url(url, notify_status_codes=None, validators=None, max_bytes=None):
+    """以流式方式从 URL 获取内容 (单次尝试, 连接失败时抛出 requests.RequestException, 由调度器负责重试)
+    返回 ContentBody, 服务器返回 304 时内容为 None"""
+    request_headers = {}
+    if validators:
+        if validators.get("etag"):
+            request_headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            request_headers["If-Modified-Since"] = validators["last_modified"]
+    session = get_http_session()
+    started = time.perf_counter()
+    with session.get(url, headers=request_headers, timeout=TIMEOUT, stream=True) as response:
+        add_stage_time("ttfb", time.perf_counter() - started)
+        if response.status_code == 304 and request_headers:
+            return None, False, 304, validators
+        if not response.ok:
+            error_state_content = f"HTTP Error: {response.status_code} {response.reason}"
+            return ContentBody.from_bytes(error_state_content.encode('utf-8')), True, response.status_code, None
+        body = read_response_body(response, url, max_bytes)
+        return body, False, None, get_response_validators(response)
+
+# curl 参数: 不带值的开关与需要值的选项 (短选项 -> 长选项)
+CURL_SWITCHES = {"-s": "--silent", "-S": "--show-error", "-L": "--location", "-k": "--insecure",
+                 "-f": "--fail", "-G": "--get", "-v": "--verbose", "-#": "--progress-bar"}
+CURL_VALUE_OPTIONS = {"-X": "--request", "-H": "--header", "-d": "--data", "-b": "--cookie", "-u": "--user",
+                      "-A": "--user-agent", "-e": "--referer", "-m": "--max-time"}
+CURL_LONG_SWITCHES = {"--silent", "--show-error", "--location", "--insecure", "--fail", "--get", "--verbose",
+                      "--compressed", "--progress-bar", "--no-progress-meter"}
+CURL_LONG_VALUE_OPTIONS = {"--request", "--header", "--data", "--data-ascii", "--data-raw", "--data-binary",
+                           "--data-urlencode", "--json", "--cookie", "--user", "--user-agent", "--referer",
+                           "--max-time", "--connect-timeout", "--url"}
+
+def _tokenize_curl_options(args):
+    """将 curl 参数拆分为 (选项, 值) 序列, 展开 -sSL、-XPOST 等合并写法; 遇到不支持的选项抛出 ValueError"""
+    options = []
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        index += 1
+        if arg.startswith("--"):
+            name, has_value, value = arg.partition("=")
+            if name in CURL_LONG_SWITCHES and not has_value:
+                options.append((name, None))
+            elif name in CURL_LONG_VALUE_OPTIONS:
+                if not has_value:
+                    if index >= len(args):
+                        raise ValueError(f"选项 {name} 缺少参数")
+                    value = args[index]
+                    index += 1
+                options.append((name, value))
             else:
-                error_state_content = f"HTTP Error: {response.status_code} {response.reason}"
-                return error_state_content.encode('utf-8'), True, response.status_code
-        except requests.RequestException as e:
-            last_exception = e
-            print(f"::warning::第 {attempt + 1}/{retry_count} 次尝试获取 '{url}' 失败: {e}")
-            if attempt < retry_count - 1:
-                print(f"将在 {retry_delay} 秒后重试...")
-                time.sleep(retry_delay)
-
-    error_state_content = f"连接错误: 重试 {retry_count} 次后依然失败 ({type(last_exception).__name__})"
-    return error_state_content.encode('utf-8'), True, last_status_code
-
-def fetch_content_from_curl(command, retry_count, retry_delay):
-    """执行 curl 命令并获取其输出, 包含重试机制"""
-    last_exception = None
-    for attempt in range(retry_count):
-        try:
+                raise ValueError(f"不支持的选项 {name}")
+        elif arg.startswith("-") and len(arg) > 1:
+            position = 1
+            while position < len(arg):
+                flag = "-" + arg[position]
+                position += 1
+                if flag in CURL_SWITCHES:
+                    options.append((CURL_SWITCHES[flag], None))
+                elif flag in CURL_VALUE_OPTIONS:
+                    value = arg[position:]
+                    if not value:
+                        if index >= len(args):
+                            raise ValueError(f"选项 {flag} 缺少参数")
+                        value = args[index]
+                        index += 1
+                    options.append((CURL_VALUE_OPTIONS[flag], value))
+                    break
+                else:
+                    raise ValueError(f"不支持的选项 {flag}")
+        else:
+            options.append(("--url", arg))
+    return options
+
+def _is_latin1(value):
+    try:
+        value.encode("latin-1")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def parse_curl_command(command):
+    """将常见的 curl 命令解析为进程内请求参数; 返回 (请求参数, None), 无法转换时返回 (None, 原因)"""
+    text = re.sub(r"\\\r?\n", " ", command).strip()
+    if "`" in text or re.search(r"\$[({\w]", text):
+        return None, "包含 shell 变量或命令替换"
+    try:
+        lexer = shlex.shlex(text, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        # bash 只把单词开头的 # 视为注释, 单词中间的 # 是普通字符
+        lexer.commenters = ""
+        args = list(lexer)
+    except ValueError as e:
+        return None, f"无法解析命令: {e}"
+    if any(arg.startswith("#") for arg in args):
+        return None, "包含注释"
+    if not args or args[0] != "curl":
+        return None, "不是单个 curl 命令"
+    if any(arg and all(c in "();<>|&" for c in arg) for arg in args):
+        return None, "包含管道、重定向或多条命令"
+    try:
+        options = _tokenize_curl_options(args[1:])
+    except ValueError as e:
+        return None, str(e)
+
+    headers = requests.structures.CaseInsensitiveDict(CURL_DEFAULT_HEADERS)
+    urls, data, cookies = [], [], []
+    method, auth, timeout = None, None, TIMEOUT
+    flags = set()
+    for name, value in options:
+        if value is None:
+            flags.add(name)
+        elif name == "--url":
+            urls.append(value)
+        elif name == "--request":
+            method = value.upper()
+        elif name == "--header":
+            key, separator, header_value = value.partition(":")
+            if not separator:
+                if not value.endswith(";"):
+                    return None, f"无法识别的请求头 {value}"
+                headers[value[:-1].strip()] = ""
+            elif header_value.strip():
+                headers[key.strip()] = header_value.strip()
+            else:
+                # curl 中 "Name:" 表示删除该请求头
+                headers[key.strip()] = None
+        elif name in ("--data", "--data-ascii", "--data-binary"):
+            if value.startswith("@"):
+                return None, "从文件读取请求体"
+            data.append(value)
+        elif name == "--data-raw":
+            data.append(value)
+        elif name == "--json":
+            if value.startswith("@"):
+                return None, "从文件读取请求体"
+            data.append(value)
+            if "Content-Type" not in headers:
+                headers["Content-Type"] = "application/json"
+            headers["Accept"] = "application/json"
+        elif name == "--data-urlencode":
+            key, separator, content = value.partition("=")
+            if "@" in (key if separator else value):
+                return None, "从文件读取请求体"
+            data.append(f"{key}={quote_plus(content)}" if key else quote_plus(content) if separator else quote_plus(value))
+        elif name == "--cookie":
+            if "=" not in value:
+                return None, "从文件读取 Cookie"
+            cookies.append(value)
+        elif name == "--user":
+            user, _, password = value.partition(":")
+            auth = (user, password)
+        elif name == "--user-agent":
+            headers["User-Agent"] = value
+        elif name == "--referer":
+            headers["Referer"] = value
+        elif name in ("--max-time", "--connect-timeout"):
+            try:
+                timeout = float(value)
+            except ValueError:
+                return None, f"无效的超时时间 {value}"
+
+    if len(urls) != 1:
+        return None, "需要且只能包含一个 URL"
+    url = urls[0] if "://" in urls[0] else f"http://{urls[0]}"
+    if "--compressed" in flags:
+        headers["Accept-Encoding"] = "gzip, deflate"
+    if cookies:
+        headers["Cookie"] = "; ".join(cookies)
+    # requests 以 Latin-1 编码请求头与认证信息, 无法编码时交给 curl 子进程按原样发送
+    if not all(_is_latin1(key) and _is_latin1(value or "") for key, value in headers.items()) or \
+            (auth and not all(_is_latin1(part) for part in auth)):
+        return None, "请求头、Cookie 或认证信息包含非 Latin-1 字符"
+    body = "&".join(data) if data else None
+    if body is not None and "--get" in flags:
+        url = f"{url}{'&' if '?' in url else '?'}{body}"
+        body = None
+    if body is not None and "Content-Type" not in headers:
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    return {
+        "method": method or ("POST" if body is not None else "GET"),
+        "url": url, "headers": dict(headers), "data": body.encode('utf-8') if body is not None else None,
+        "auth": auth, "timeout": timeout, "allow_redirects": "--location" in flags,
+        "verify": "--insecure" not in flags, "fail": "--fail" in flags,
+    }, None
+
+def fetch_content_from_curl_request(request, validators=None, max_bytes=None):
+    """在进程内执行已解析的 curl 请求, 复用共享连接池 (单次尝试); 返回值与 fetch_content_from_url 一致"""
+    headers = dict(request["headers"])
+    # 只有不带请求体的 GET 请求才使用条件请求
+    cacheable = request["method"] == "GET" and request["data"] is None
+    conditional = cacheable and bool(validators)
+    if conditional:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    session = get_http_session()
+    started = time.perf_counter()
+    with session.request(request["method"], request["url"], headers=headers, data=request["data"],
+                         auth=request["auth"], timeout=request["timeout"], stream=True,
+                         allow_redirects=request["allow_redirects"], verify=request["verify"]) as response:
+        add_stage_time("ttfb", time.perf_counter() - started)
+        if response.status_code == 304 and conditional:
+            return None, False, 304, validators
+        if request["fail"] and response.status_code >= 400:
+            # 与 curl --fail 一致: HTTP 错误视为命令失败
+            error_state_content = f"cURL 命令失败: 退出码 22\n错误: curl: (22) The requested URL returned error: {response.status_code}"
+            return ContentBody.from_bytes(error_state_content.encode('utf-8')), True, response.status_code, None
+        # 与子进程的文本模式输出保持一致, 避免切换执行方式后哈希变化
+        body = read_response_body(response, request["url"], max_bytes, translate_newlines=True)
+        return body, False, None, get_response_validators(response) if cacheable else None
+
+def fetch_content_from_curl(command):
+    """执行 curl 命令并获取其输出 (单次尝试, 命令失败或超时时抛出异常, 由调度器负责重试)"""
+    try:
+        # 子进程无法区分连接与下载, 整体计入传输阶段
+        with timed_stage("transfer"):
             result = subprocess.run(command, shell=True, capture_output=True, text=True, check=True, timeout=TIMEOUT)
-            return result.stdout.encode('utf-8'), False, None
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-            last_exception = e
-            error_details = e.stderr if isinstance(e, subprocess.CalledProcessError) else "Timeout"
-            print(f"::warning::第 {attempt + 1}/{retry_count} 次执行 curl 命令失败: {error_details.strip()}")
-            if attempt < retry_count - 1:
-                print(f"将在 {retry_delay} 秒后重试...")
-                time.sleep(retry_delay)
-        except Exception as e:
-            print(f"::error::执行 curl 命令时发生未知错误: {e}")
-            error_state_content = f"Unknown cURL Error: {type(e).__name__}"
-            return error_state_content.encode('utf-8'), True, None
-
-    if isinstance(last_exception, subprocess.CalledProcessError):
-        error_state_content = f"cURL 命令失败: 重试 {retry_count} 次后依然失败 (退出码 {last_exception.returncode})\n错误: {last_exception.stderr.strip()}"
-    elif isinstance(last_exception, subprocess.TimeoutExpired):
-        error_state_content = f"cURL 命令超时: 重试 {retry_count} 次后依然失败"
+        return result.stdout.encode('utf-8'), False, None
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        raise
+    except Exception as e:
+        print(f"::error::执行 curl 命令时发生未知错误: {e}")
+        error_state_content = f"Unknown cURL Error: {type(e).__name__}"
+        return error_state_content.encode('utf-8'), True, None
+
+def is_connection_failure(error):
+    """判断抓取异常是否为连接层面的失败 (计入熔断器); 收到任何 HTTP 响应都说明主机可达"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, subprocess.TimeoutExpired)):
+        return True
+    return isinstance(error, subprocess.CalledProcessError) and error.returncode in CURL_CONNECTION_EXIT_CODES
+
+def describe_fetch_error(error):
+    """用于日志的单行异常描述"""
+    if isinstance(error, subprocess.CalledProcessError):
+        return (error.stderr or "").strip() or f"退出码 {error.returncode}"
+    if isinstance(error, subprocess.TimeoutExpired):
+        return "Timeout"
+    return str(error)
+
+def build_fetch_error(job, error, attempts, circuit_open=False):
+    """根据最后一次失败构造错误状态结果; 内容不含时间等易变信息, 以免同一故障反复生成新快照"""
+    reason = f"主机 {job['host']} 已熔断" if circuit_open else f"重试 {attempts} 次后依然失败"
+    if job["type"] == "url":
+        error_state_content = f"连接错误: {reason} ({type(error).__name__})"
+    elif job["curl_request"]:
+        error_state_content = f"cURL 命令失败: {reason} ({type(error).__name__})"
+    elif isinstance(error, subprocess.CalledProcessError):
+        error_state_content = f"cURL 命令失败: {reason} (退出码 {error.returncode})\n错误: {(error.stderr or '').strip()}"
+    elif isinstance(error, subprocess.TimeoutExpired):
+        error_state_content = f"cURL 命令超时: {reason}"
     else:
-        error_state_content = f"cURL 命令失败: 重试 {retry_count} 次后依然失败"
+        error_state_content = f"cURL 命令失败: {reason}"
+    return {"content": ContentBody.from_bytes(error_state_content.encode('utf-8')), "is_error": True,
+            "status_code": None, "validators": None}
+
+def build_skipped_result(reason, returned=False):
+    """未执行抓取的结果: 不计算哈希、不写快照, 目标保持上次的状态; returned 表示任务来源关闭时交还的未开始任务"""
+    return {"content": None, "is_error": False, "status_code": None, "validators": None, "skipped": reason, "returned": returned}
+
+class CircuitBreaker:
+    """按主机统计连续的连接失败, 达到阈值后熔断: 冷却期内该主机的其余目标直接跳过,
+    冷却结束后只放行一个探测请求, 成功则恢复, 失败则重新熔断; 状态保存在 STATE_DIR 中跨运行保留"""
+
+    def __init__(self, state, failure_threshold=3, cooldown_seconds=600):
+        self.state = state
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.probing = set()
+
+    def check(self, host):
+        """返回 allow (可以请求) / wait (探测请求进行中, 稍后再试) / reject (熔断中)"""
+        entry = self.state.get(host)
+        if not entry or entry.get("opened_at") is None:
+            return "allow"
+        if time.time() - entry["opened_at"] < self.cooldown_seconds:
+            return "reject"
+        if host in self.probing:
+            return "wait"
+        self.probing.add(host)
+        return "allow"
+
+    def record_success(self, host):
+        """主机有响应: 清除失败计数并关闭熔断器"""
+        self.probing.discard(host)
+        entry = self.state.pop(host, None)
+        if entry and entry.get("opened_at") is not None:
+            print(f"::notice::主机 {host} 已恢复，熔断器关闭。")
+
+    def record_failure(self, host):
+        """记录一次连接失败, 达到阈值或探测失败时打开熔断器"""
+        entry = self.state.setdefault(host, {"failures": 0, "opened_at": None})
+        entry["failures"] += 1
+        probe_failed = host in self.probing
+        self.probing.discard(host)
+        if probe_failed or (entry["opened_at"] is None and entry["failures"] >= self.failure_threshold):
+            entry["opened_at"] = time.time()
+            print(f"::warning::主机 {host} 连续 {entry['failures']} 次连接失败，熔断 {self.cooldown_seconds:g} 秒，该主机的其余目标将被跳过。")
+
+    def release_probe(self, host):
+        """请求因意外错误没有结果: 探测请求按探测失败处理 (重新熔断), 以免该主机的其余目标一直等待;
+        普通请求不计入连续连接失败"""
+        if host in self.probing:
+            self.record_failure(host)
+
+def get_circuit_breaker(settings, state):
+    """根据配置创建熔断器, failure_threshold 为 0 时不启用"""
+    options = dict(DEFAULT_CIRCUIT_BREAKER)
+    options.update(settings.get("circuit_breaker") or {})
+    if not int(options["failure_threshold"]):
+        return None
+    return CircuitBreaker(state, options["failure_threshold"], options["cooldown_seconds"])
+
+def get_retry_delay(attempt, retry_delay):
+    """第 attempt 次失败后的等待时间: 指数退避 (有上限) 加随机抖动, 避免大量目标同时重试"""
+    backoff = min(retry_delay * (2 ** (attempt - 1)), RETRY_MAX_DELAY_SECONDS)
+    return backoff + random.uniform(0, retry_delay)
+
+def build_fetch_job(seq, target, settings):
+    """解析单个监控目标配置, 生成抓取任务; 配置无效时返回 None"""
+    name = target.get("name")
+    type = target.get("type")
+    command, curl_request = None, None
+    if type == "url":
+        target_url = target.get("value")
+        if not target_url:
+            print(f"::warning::类型为 'url' 的目标缺少 'value' 字段，已跳过。")
+            return None
+    elif type == "curl":
+        command = target.get("command")
+        if not command:
+            print(f"::warning::类型为 'curl' 的目标缺少 'command' 字段，已跳过。")
+            return None
+        target_url = extract_url_from_curl(command)
+        if not target_url:
+            print(f"::error::无法从 curl 命令中解析出 URL，请检查命令: [{command}]")
+            return None
+        curl_request, reason = parse_curl_command(command)
+        if reason:
+            print(f"::notice::curl 命令{reason}，将通过子进程执行: {target_url}")
+    else:
+        print(f"::warning::不支持的类型 '{type}'，目标 '{name or '未命名'}' 已跳过。")
+        return None
+
+    safe_name = get_safe_filename_from_url(target_url)
+    if not safe_name:
+        print(f"::warning::无法为 URL '{target_url}' 生成文件夹名，已跳过。")
+        return None
+
+    try:
+        pipeline = build_pipeline(target.get("process"))
+    except ValueError as e:
+        print(f"::warning::目标 '{name or target_url}' 的内容处理配置无效，已跳过: {e}")
+        return None
+
+    ignore_paths = []
+    for path in target.get("ignore_paths") or []:
+        try:
+            ignore_paths.append(parse_json_path(path))
+        except ValueError as e:
+            print(f"::warning::目标 '{name or target_url}' 的忽略路径无效，已忽略: {e}")
+
+    return {
+        "seq": seq, "name": name, "type": type, "url": target_url,
+        "command": command, "curl_request": curl_request, "host": urlparse(target_url).netloc.lower(),
+        "safe_name": safe_name, "target": target,
+        "max_bytes": get_max_bytes(target, settings),
+        "format": target.get("format"), "ignore_paths": ignore_paths,
+        "pipeline": pipeline,
+    }
 
-    return error_state_content.encode('utf-8'), True, None
+def fetch_job(job, timings=None):
+    """执行单个抓取任务的一次尝试, 返回抓取结果; 内容为 None 表示服务器确认内容未修改 (304)
+    各阶段耗时累加到 timings 中, 多次尝试的耗时合并计算"""
+    validators = None
+    url_dir = os.path.join(SNAPSHOT_DIR, job["safe_name"])
+    with collect_stage_times(timings if timings is not None else {}):
+        if job["type"] == "url":
+            content, is_error, status_code, validators = fetch_content_from_url(
+                job["url"], None, load_validators(url_dir), job["max_bytes"])
+        elif job["curl_request"]:
+            content, is_error, status_code, validators = fetch_content_from_curl_request(
+                job["curl_request"], load_validators(url_dir), job["max_bytes"])
+        else:
+            output, is_error, status_code = fetch_content_from_curl(job["command"])
+            content = ContentBody.from_bytes(output, None if is_error else job["max_bytes"])
+        size = content.size if content is not None else 0
+        if content is not None and not is_error:
+            with timed_stage("process"):
+                content = process_content(job, content)
+    return {"content": content, "is_error": is_error, "status_code": status_code, "validators": validators, "bytes": size}
+
+def run_fetch_jobs(jobs, settings, breaker=None, deadline=None, feed=None):
+    """并发执行抓取任务, 同时受全局并发数与单主机并发数限制, 按完成顺序产出 (任务, 结果)
+    失败的尝试按指数退避重新排队而不占用工作线程; 熔断中的主机与超过截止时间 (time.monotonic) 未完成的目标产出跳过结果
+    提供 feed 时持续运行: 每轮调用 feed() 取得 (新到期的任务, 最长等待秒数), 返回 None 后处理完剩余任务即结束"""
+    max_workers = max(1, int(settings.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)))
+    max_per_host = max(1, int(settings.get("max_per_host", DEFAULT_MAX_PER_HOST)))
+    retry_count = max(1, int(settings.get("retry_count", 3)))
+    retry_delay = float(settings.get("retry_delay_seconds", 5))
+    get_http_session(max_per_host)
+    # 待执行队列与延迟重试堆中的条目: (任务, 已尝试次数, 上次的异常)
+    pending = deque((job, 0, None) for job in jobs)
+    delayed = []
+    in_flight = {}
+    host_load = defaultdict(int)
+    deferred = []
+    timings = defaultdict(dict)
+    attempt_counts = defaultdict(int)
+    feed_wait = None
+
+    def finish(job, result):
+        """为结果附加该目标的各阶段耗时与尝试次数"""
+        result["timings"] = timings.pop(job["seq"], {})
+        result["attempts"] = attempt_counts.pop(job["seq"], 0)
+        return job, result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or delayed or in_flight or feed:
+            if feed:
+                fed = feed()
+                if fed is None:
+                    # 任务来源已关闭: 尚未开始的任务交还给调用方, 只等待进行中的请求完成
+                    feed = feed_wait = None
+                    remaining = list(pending) + [entry for _, _, entry in delayed]
+                    pending.clear()
+                    delayed = []
+                    for job, _, _ in remaining:
+                        yield finish(job, build_skipped_result("抓取已停止", returned=True))
+                else:
+                    new_jobs, feed_wait = fed
+                    pending.extend((job, 0, None) for job in new_jobs)
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                _, _, entry = heapq.heappop(delayed)
+                pending.append(entry)
+            if deadline is not None and now >= deadline and (pending or delayed):
+                # 超过截止时间: 尚未开始的目标推迟到下次运行, 进行中的请求正常完成
+                remaining = list(pending) + [entry for _, _, entry in delayed]
+                pending.clear()
+                delayed = []
+                for job, _, _ in sorted(remaining, key=lambda entry: entry[0]["seq"]):
+                    deferred.append(job["name"] or job["url"])
+                    yield finish(job, build_skipped_result("超过本次运行的截止时间，推迟到下次运行"))
+
+            # 按配置顺序提交任务, 所在主机已满载或正在探测的任务留待下一轮
+            blocked = deque()
+            while pending and len(in_flight) < max_workers:
+                job, attempts, error = pending.popleft()
+                if host_load[job["host"]] >= max_per_host:
+                    blocked.append((job, attempts, error))
+                    continue
+                state = breaker.check(job["host"]) if breaker else "allow"
+                if state == "wait":
+                    blocked.append((job, attempts, error))
+                    continue
+                if state == "reject":
+                    yield finish(job, build_fetch_error(job, error, attempts, circuit_open=True) if attempts else build_skipped_result(f"主机 {job['host']} 处于熔断状态"))
+                    continue
+                host_load[job["host"]] += 1
+                attempt_counts[job["seq"]] = attempts + 1
+                in_flight[executor.submit(fetch_job, job, timings[job["seq"]])] = (job, attempts + 1)
+            blocked.extend(pending)
+            pending = blocked
+
+            timeout = None
+            if delayed:
+                timeout = max(0.0, delayed[0][0] - time.monotonic())
+            if deadline is not None and (pending or delayed):
+                timeout = max(0.0, min(timeout if timeout is not None else float("inf"), deadline - time.monotonic()))
+            if feed_wait is not None:
+                timeout = min(timeout if timeout is not None else float("inf"), feed_wait)
+            if not in_flight:
+                if timeout:
+                    time.sleep(timeout)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, attempts = in_flight.pop(future)
+                host_load[job["host"]] -= 1
+                try:
+                    fetched = future.result()
+                except RETRYABLE_FETCH_ERRORS as e:
+                    if breaker:
+                        if is_connection_failure(e):
+                            breaker.record_failure(job["host"])
+                        else:
+                            breaker.record_success(job["host"])
+                    print(f"::warning::第 {attempts}/{retry_count} 次尝试获取 '{job['name'] or job['url']}' 失败: {describe_fetch_error(e)}")
+                    if attempts >= retry_count:
+                        yield finish(job, build_fetch_error(job, e, attempts))
+                        continue
+                    delay = get_retry_delay(attempts, retry_delay)
+                    print(f"将在 {delay:.1f} 秒后重试...")
+                    heapq.heappush(delayed, (time.monotonic() + delay, job["seq"], (job, attempts, e)))
+                    continue
+                except Exception as e:
+                    # 意外的异常只影响该目标: 保持上次的状态, 不中断其他目标的抓取
+                    if breaker:
+                        breaker.release_probe(job["host"])
+                    print(f"::error::获取 '{job['name'] or job['url']}' 时出现意外错误: {e!r}")
+                    yield finish(job, build_skipped_result(f"出现意外错误: {e}"))
+                    continue
+                if breaker:
+                    breaker.record_success(job["host"])
+                yield finish(job, fetched)
+    if deferred:
+        print(f"::warning::已超过本次运行的截止时间，{len(deferred)} 个目标推迟到下次运行: {', '.join(deferred)}")
+
+def iter_results_in_order(jobs, results):
+    """将按完成顺序到达的结果重新排列为配置顺序, 前面的目标一旦就绪即可立即处理"""
+    buffered = {}
+    next_seq = 0
+    order = [job["seq"] for job in jobs]
+    for job, fetched in results:
+        buffered[job["seq"]] = (job, fetched)
+        while next_seq < len(order) and order[next_seq] in buffered:
+            yield buffered.pop(order[next_seq])
+            next_seq += 1
+
+def read_latest_hash(url_dir):
+    """读取目标的最新哈希, 优先使用内存缓存"""
+    if url_dir not in _latest_hashes:
+        latest_hash = None
+        latest_hash_file = os.path.join(url_dir, "latest.hash")
+        if os.path.exists(latest_hash_file):
+            with open(latest_hash_file, "r", encoding="utf-8") as f:
+                latest_hash = f.read().strip()
+        _latest_hashes[url_dir] = latest_hash
+    return _latest_hashes[url_dir]
+
+def write_latest_hash(url_dir, content_hash):
+    """写入目标的最新哈希并更新内存缓存"""
+    with open(os.path.join(url_dir, "latest.hash"), "w", encoding="utf-8") as f:
+        f.write(content_hash)
+    _latest_hashes[url_dir] = content_hash
 
 def get_content_hash(content):
     """计算内容的SHA-256哈希值"""
     return hashlib.sha256(content).hexdigest()
 
-def send_webhook_notification(webhook_urls_str, timestamp, summary):
-    """向多个 Webhook 地址发送通知"""
-    if not webhook_urls_str:
+def get_compression(settings):
+    """获取快照对象的压缩格式; 未安装 zstandard 时回退到 gzip"""
+    compression = str(settings.get("snapshot_compression", "gzip")).lower()
+    if compression == "zstd" and zstandard is None:
+        print("::warning::未安装 zstandard，快照压缩回退为 gzip。")
+        return "gzip"
+    return "zstd" if compression == "zstd" else "gzip"
+
+def get_object_path(content_hash, compression):
+    """返回对象在存储中的相对路径 (相对于 SNAPSHOT_DIR)"""
+    extension = "zst" if compression == "zstd" else "gz"
+    return f"{OBJECTS_DIRNAME}/{content_hash[:2]}/{content_hash}.{extension}"
+
+def find_object(content_hash):
+    """查找已存在的对象, 返回其相对路径; 不存在时返回 None"""
+    for compression in ("gzip", "zstd"):
+        relative_path = get_object_path(content_hash, compression)
+        if os.path.exists(os.path.join(SNAPSHOT_DIR, relative_path)):
+            return relative_path
+    return None
+
+def store_object(content, content_hash, compression):
+    """将内容以哈希为键压缩写入对象存储, 相同内容只保存一份; content 可以是 bytes 或 ContentBody"""
+    existing = find_object(content_hash)
+    if existing:
+        return existing
+    relative_path = get_object_path(content_hash, compression)
+    object_path = os.path.join(SNAPSHOT_DIR, relative_path)
+    os.makedirs(os.path.dirname(object_path), exist_ok=True)
+    tmp_path = f"{object_path}.tmp"
+    with open(tmp_path, "wb") as raw:
+        if compression == "zstd":
+            writer = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            # 固定 mtime, 保证相同内容生成完全相同的压缩文件
+            writer = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+        with writer:
+            if isinstance(content, bytes):
+                writer.write(content)
+            else:
+                content.copy_to(writer)
+    os.replace(tmp_path, object_path)
+    return relative_path
+
+def read_object(relative_path):
+    """读取并解压对象内容"""
+    object_path = os.path.join(SNAPSHOT_DIR, relative_path)
+    if relative_path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"读取 {relative_path} 需要安装 zstandard")
+        with open(object_path, "rb") as f:
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+    with gzip.open(object_path, "rb") as f:
+        return f.read()
+
+def write_snapshot(change_dir, kind, content, content_hash, compression, status_code=None, truncated=False):
+    """将快照内容写入对象存储, 并在版本目录中写入指向该对象的元数据"""
+    meta = {
+        "kind": kind,
+        "hash": content_hash,
+        "size": content.size if isinstance(content, ContentBody) else len(content),
+        "object": store_object(content, content_hash, compression),
+    }
+    if status_code:
+        meta["status_code"] = status_code
+    if truncated:
+        meta["truncated"] = True
+    with open(os.path.join(change_dir, SNAPSHOT_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+def decode_lines(data):
+    """按文本模式 (通用换行) 解码内容并拆分为行 (不含换行符)"""
+    lines = io.StringIO(data.decode('utf-8', errors='ignore'), newline=None).readlines()
+    return [line[:-1] if line.endswith("\n") else line for line in lines]
+
+def split_tokens(lines):
+    """将压缩/单行内容拆分为标记: 在标签、逗号、分号与括号处断开"""
+    tokens = []
+    for line in lines:
+        tokens.extend(token for token in re.split(r'(?<=[>,;{}\]])|(?=<)', line) if token)
+    return tokens
+
+def is_minified(lines):
+    """判断内容是否为压缩/单行格式"""
+    return bool(lines) and sum(len(line) for line in lines) / len(lines) > MINIFIED_LINE_LENGTH
+
+def _myers_opcodes(a, b, alo, ahi, blo, bhi, max_d):
+    """Myers O(ND) 差异算法, 返回按顺序排列的操作; 编辑距离超过 max_d 时返回 None"""
+    n, m = ahi - alo, bhi - blo
+    max_d = min(max_d, n + m)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                trace.append(v[offset - d:offset + d + 1])
+                return _myers_backtrack(trace, n, m, alo, blo)
+        trace.append(v[offset - d:offset + d + 1])
+    return None
+
+def _myers_backtrack(trace, n, m, alo, blo):
+    """根据 Myers 算法的搜索轨迹回溯出操作序列"""
+    ops = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        previous = trace[d - 1]
+        k = x - y
+        if k == -d or (k != d and previous[k - 1 + d - 1] < previous[k + 1 + d - 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = previous[prev_k + d - 1]
+        prev_y = prev_x - prev_k
+        if x > prev_x and y > prev_y:
+            snake = min(x - prev_x, y - prev_y)
+            ops.append(("equal", alo + x - snake, alo + x, blo + y - snake, blo + y))
+            x, y = x - snake, y - snake
+        if prev_k == k + 1:
+            ops.append(("insert", alo + x, alo + x, blo + y - 1, blo + y))
+        else:
+            ops.append(("delete", alo + x - 1, alo + x, blo + y, blo + y))
+        x, y = prev_x, prev_y
+    if x > 0 and y > 0:
+        ops.append(("equal", alo, alo + x, blo, blo + y))
+    ops.reverse()
+    return ops
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """Patience 算法: 找出在两侧都只出现一次的行, 取其最长递增子序列作为锚点"""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.setdefault(a[i], [0, 0, i, None])
+        entry[0] += 1
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+    pairs = sorted((entry[2], entry[3]) for entry in counts.values() if entry[0] == 1 and entry[1] == 1)
+    if not pairs:
+        return []
+    # 按 a 的顺序对 b 的下标求最长递增子序列
+    tails, tail_index, back = [], [], [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        back[index] = tail_index[pos - 1] if pos else None
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(index)
+        else:
+            tails[pos] = j
+            tail_index[pos] = index
+    anchors = []
+    index = tail_index[-1]
+    while index is not None:
+        anchors.append(pairs[index])
+        index = back[index]
+    anchors.reverse()
+    return anchors
+
+def _iter_raw_opcodes(a, b, deadline):
+    """Patience + Myers 组合差异算法, 按顺序产出操作 (可能包含相邻的同类操作)"""
+    stack = [("diff", 0, len(a), 0, len(b))]
+    while stack:
+        kind, alo, ahi, blo, bhi = stack.pop()
+        if kind != "diff":
+            yield kind, alo, ahi, blo, bhi
+            continue
+        start = alo
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            alo += 1
+            blo += 1
+        if alo > start:
+            yield "equal", start, alo, blo - (alo - start), blo
+        end = ahi
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+        if ahi < end:
+            stack.append(("equal", ahi, end, bhi, bhi + (end - ahi)))
+        if alo == ahi or blo == bhi or time.monotonic() > deadline:
+            if alo < ahi:
+                yield "delete", alo, ahi, blo, blo
+            if blo < bhi:
+                yield "insert", ahi, ahi, blo, bhi
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if anchors:
+            # 逆序压栈, 保证按从前到后的顺序处理
+            next_i, next_j = ahi, bhi
+            for i, j in reversed(anchors):
+                stack.append(("diff", i + 1, next_i, j + 1, next_j))
+                stack.append(("equal", i, i + 1, j, j + 1))
+                next_i, next_j = i, j
+            stack.append(("diff", alo, next_i, blo, next_j))
+            continue
+        ops = _myers_opcodes(a, b, alo, ahi, blo, bhi, DIFF_MAX_EDIT_DISTANCE)
+        if ops is None:
+            yield "delete", alo, ahi, blo, blo
+            yield "insert", ahi, ahi, blo, bhi
+        else:
+            yield from ops
+
+def iter_opcodes(a, b, time_budget=DIFF_TIME_BUDGET):
+    """按顺序产出合并后的差异操作 (tag, i1, i2, j1, j2), 超出耗时预算的部分按整段替换处理"""
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a]
+    b = [ids.setdefault(line, len(ids)) for line in b]
+    pending = None
+    for op in _iter_raw_opcodes(a, b, time.monotonic() + time_budget):
+        if pending and pending[0] == op[0] and pending[2] == op[1] and pending[4] == op[3]:
+            pending = (pending[0], pending[1], op[2], pending[3], op[4])
+            continue
+        if pending:
+            yield pending
+        pending = op
+    if pending:
+        yield pending
+
+def _group_opcodes(opcodes, n=DIFF_CONTEXT_LINES):
+    """将操作流按上下文行数分组为变更块, 与 difflib 的分组规则一致"""
+    group = []
+    pending_equal = None
+    for op in opcodes:
+        if op[0] == "equal":
+            pending_equal = op
+            continue
+        if pending_equal:
+            tag, i1, i2, j1, j2 = pending_equal
+            if not group:
+                i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+            elif i2 - i1 > n + n:
+                group.append((tag, i1, i1 + n, j1, j1 + n))
+                yield group
+                group = []
+                i1, j1 = i2 - n, j2 - n
+            group.append((tag, i1, i2, j1, j2))
+            pending_equal = None
+        group.append(op)
+    if group:
+        if pending_equal:
+            tag, i1, i2, j1, j2 = pending_equal
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+        yield group
+
+def _format_range(start, stop):
+    """格式化统一差异格式中的行号范围"""
+    length = stop - start
+    beginning = start + 1 if length else start
+    return str(beginning) if length == 1 else f"{beginning},{length}"
+
+def iter_unified_diff(old_content, new_content):
+    """逐行产出两个版本之间的统一差异格式内容; 压缩/单行内容按标记比较"""
+    a, b = decode_lines(old_content), decode_lines(new_content)
+    if is_minified(a) or is_minified(b):
+        a, b = split_tokens(a), split_tokens(b)
+    started = False
+    for group in _group_opcodes(iter_opcodes(a, b)):
+        if not started:
+            yield "--- old"
+            yield "+++ new"
+            started = True
+        yield f"@@ -{_format_range(group[0][1], group[-1][2])} +{_format_range(group[0][3], group[-1][4])} @@"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            for line in a[i1:i2]:
+                yield "-" + line
+            for line in b[j1:j2]:
+                yield "+" + line
+
+def parse_json_path(path):
+    """解析 JSONPath 风格的忽略路径, 支持 $.key、['key']、[0]、[*]、.* 与 ..key (递归匹配)"""
+    if not path.startswith("$"):
+        raise ValueError(f"路径必须以 '$' 开头: {path}")
+    steps = []
+    pattern = re.compile(r"\.\.([^.\[]+)|\.([^.\[]+)|\[(\*|-?\d+|'[^']*'|\"[^\"]*\")\]")
+    position = 1
+    while position < len(path):
+        match = pattern.match(path, position)
+        if not match:
+            raise ValueError(f"无法解析的路径: {path}")
+        recursive_key, key, bracket = match.groups()
+        if recursive_key is not None:
+            steps.append(("recursive", recursive_key))
+        elif key is not None:
+            steps.append(("wildcard", None) if key == "*" else ("key", key))
+        elif bracket == "*":
+            steps.append(("wildcard", None))
+        elif bracket[0] in "'\"":
+            steps.append(("key", bracket[1:-1]))
+        else:
+            steps.append(("index", int(bracket)))
+        position = match.end()
+    return steps
+
+def remove_json_path(data, steps):
+    """从 JSON 数据中原地删除与路径匹配的字段"""
+    if not steps:
         return
-    urls = [url.strip() for url in webhook_urls_str.split(',') if url.strip()]
-    custom_payload_str = os.environ.get("WEBHOOK_CUSTOM_PAYLOAD")
-    for url in urls:
-        try:
-            if custom_payload_str:
-                payload_str = custom_payload_str.replace("{timestamp}", timestamp).replace("{changes_summary}", summary)
-                payload = json.loads(payload_str)
+    kind, value = steps[0]
+    rest = steps[1:]
+    if kind == "recursive":
+        children = data.values() if isinstance(data, dict) else data if isinstance(data, list) else []
+        for child in list(children):
+            remove_json_path(child, steps)
+        if isinstance(data, dict) and value in data:
+            if rest:
+                remove_json_path(data[value], rest)
             else:
-                text_content = (f"网页/API 变更监控提醒\n检测时间: {timestamp}\n\n{summary}")
-                payload = {"msgtype": "text", "text": {"content": text_content}}
-            requests.post(url, json=payload, timeout=10)
-            print(f"Webhook 通知已发送至: {url}")
+                del data[value]
+        return
+    if kind == "wildcard":
+        keys = list(data.keys()) if isinstance(data, dict) else list(range(len(data))) if isinstance(data, list) else []
+    elif kind == "key":
+        keys = [value] if isinstance(data, dict) and value in data else []
+    else:
+        keys = [value] if isinstance(data, list) and -len(data) <= value < len(data) else []
+    for key in sorted(keys, key=lambda k: k if isinstance(k, int) else 0, reverse=True):
+        if rest:
+            remove_json_path(data[key], rest)
+        else:
+            del data[key]
+
+def canonicalize_json(data, ignore_paths=()):
+    """删除忽略的字段后, 以键排序、固定缩进的形式序列化 JSON, 使键顺序与空白变化不影响哈希"""
+    for steps in ignore_paths:
+        remove_json_path(data, steps)
+    return (json.dumps(data, ensure_ascii=False, sort_keys=True, indent=2) + "\n").encode('utf-8')
+
+def _format_json_key(path, key):
+    if isinstance(key, int):
+        return f"{path}[{key}]"
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_-]*", key):
+        return f"{path}.{key}"
+    return f"{path}[{json.dumps(key, ensure_ascii=False)}]"
+
+def _format_json_value(value):
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    if len(text) > JSON_VALUE_DISPLAY_LENGTH:
+        text = text[:JSON_VALUE_DISPLAY_LENGTH] + "…"
+    return text
+
+def iter_json_diff(old, new, path="$"):
+    """逐行产出两个 JSON 值之间基于路径的结构化差异, 如 $.data[3].title: "a" → "b" """
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new)):
+            child = _format_json_key(path, key)
+            if key not in new:
+                yield f"- {child}: {_format_json_value(old[key])}"
+            elif key not in old:
+                yield f"+ {child}: {_format_json_value(new[key])}"
+            else:
+                yield from iter_json_diff(old[key], new[key], child)
+    elif isinstance(old, list) and isinstance(new, list):
+        # 以元素的规范化序列化结果对齐列表, 插入或删除元素不会导致后续元素全部被判为变化
+        old_keys = [json.dumps(item, sort_keys=True) for item in old]
+        new_keys = [json.dumps(item, sort_keys=True) for item in new]
+        deleted = None
+        for tag, i1, i2, j1, j2 in iter_opcodes(old_keys, new_keys):
+            if tag == "delete":
+                deleted = (i1, i2)
+                continue
+            if tag == "insert" and deleted:
+                # 相邻的删除与插入视为逐个元素的修改
+                d1, d2 = deleted
+                paired = min(d2 - d1, j2 - j1)
+                for offset in range(paired):
+                    yield from iter_json_diff(old[d1 + offset], new[j1 + offset], _format_json_key(path, j1 + offset))
+                for index in range(d1 + paired, d2):
+                    yield f"- {_format_json_key(path, index)}: {_format_json_value(old[index])}"
+                for index in range(j1 + paired, j2):
+                    yield f"+ {_format_json_key(path, index)}: {_format_json_value(new[index])}"
+                deleted = None
+                continue
+            if deleted:
+                for index in range(*deleted):
+                    yield f"- {_format_json_key(path, index)}: {_format_json_value(old[index])}"
+                deleted = None
+            if tag == "insert":
+                for index in range(j1, j2):
+                    yield f"+ {_format_json_key(path, index)}: {_format_json_value(new[index])}"
+        if deleted:
+            for index in range(*deleted):
+                yield f"- {_format_json_key(path, index)}: {_format_json_value(old[index])}"
+    elif old != new or type(old) is not type(new):
+        yield f"{path}: {_format_json_value(old)} → {_format_json_value(new)}"
+
+def iter_content_diff(job, old_content, new_content):
+    """按目标的内容格式选择差异算法: JSON 目标使用结构化差异, 其余使用统一差异格式"""
+    if job.get("format") == "json":
+        try:
+            old_data = json.loads(old_content.decode('utf-8'))
+            new_data = json.loads(new_content.decode('utf-8'))
+        except ValueError:
+            pass
+        else:
+            for steps in job.get("ignore_paths", []):
+                remove_json_path(old_data, steps)
+            return iter_json_diff(old_data, new_data)
+    return iter_unified_diff(old_content, new_content)
+
+def _select_css(text, selector):
+    """使用 CSS 选择器提取元素 (按需导入 lxml 与 cssselect)"""
+    try:
+        import lxml.html
+    except ImportError:
+        raise RuntimeError("CSS 选择需要安装 lxml 与 cssselect")
+    document = lxml.html.fromstring(text)
+    return "\n".join(lxml.html.tostring(element, encoding="unicode", with_tail=False) for element in document.cssselect(selector))
+
+def _select_xpath(text, expression):
+    """使用 XPath 提取元素或文本 (按需导入 lxml)"""
+    try:
+        import lxml.html
+    except ImportError:
+        raise RuntimeError("XPath 选择需要安装 lxml")
+    document = lxml.html.fromstring(text)
+    parts = []
+    for item in document.xpath(expression):
+        if isinstance(item, str):
+            parts.append(str(item))
+        else:
+            parts.append(lxml.html.tostring(item, encoding="unicode", with_tail=False))
+    return "\n".join(parts)
+
+def _strip_tags(text, tags):
+    """删除指定标签及其内容, 如 script、style"""
+    for tag in tags:
+        tag = re.escape(tag)
+        text = re.sub(rf"<{tag}\b[^>]*>.*?</{tag}\s*>|<{tag}\b[^>]*/>", "", text, flags=re.IGNORECASE | re.DOTALL)
+    return text
+
+def _drop_attributes(text, attributes):
+    """删除标签中的指定属性, 如 nonce、data-csrf"""
+    names = "|".join(re.escape(name) for name in attributes)
+    attribute = re.compile(rf"\s+(?:{names})(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s>]+))?(?=[\s/>])", re.IGNORECASE)
+    return re.sub(r"<[A-Za-z][^>]*>", lambda tag: attribute.sub("", tag.group(0)), text)
+
+def _strip_query_params(text, params):
+    """删除 URL 中的指定查询参数, 如缓存破坏参数 v、_t; 只改写包含这些参数的查询串, 正文中的 ? 与 & 保持不变"""
+    names = set(params)
+
+    def rewrite_query(match):
+        # HTML 属性中的分隔符可能写作 &amp;, 重建时沿用原文的写法
+        parts = re.split(r"(&amp;|&)", match.group(1))
+        pairs = parts[0::2]
+        kept = [pair for pair in pairs if pair.split("=", 1)[0] not in names]
+        if len(kept) == len(pairs):
+            return match.group(0)
+        if not kept:
+            return ""
+        separator = parts[1] if len(parts) > 1 else "&"
+        return "?" + separator.join(kept)
+
+    return re.sub(r"\?([^?#\"'\s<>]+)", rewrite_query, text)
+
+def _normalize_whitespace(text, enabled=True):
+    """合并连续空白并删除空行"""
+    if not enabled:
+        return text
+    lines = (re.sub(r"[ \t\f\v]+", " ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+def _regex_replace(text, rules):
+    """按正则表达式替换内容, 用于清除 CSRF 令牌、服务器时间等易变内容"""
+    for pattern, replacement in rules:
+        text = pattern.sub(replacement, text)
+    return text
+
+def _compile_regex_rules(value):
+    rules = value if isinstance(value, list) else [value]
+    compiled = []
+    for rule in rules:
+        if not isinstance(rule, dict) or "pattern" not in rule:
+            raise ValueError("regex_replace 需要 pattern 字段")
+        compiled.append((re.compile(rule["pattern"], re.DOTALL), rule.get("replacement", "")))
+    return compiled
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value or [])
+
+# 内容处理步骤: 配置中的键 -> (处理函数, 参数转换函数)
+PIPELINE_STEPS = {
+    "select": (_select_css, str),
+    "xpath": (_select_xpath, str),
+    "strip_tags": (_strip_tags, _as_list),
+    "drop_attributes": (_drop_attributes, _as_list),
+    "strip_query_params": (_strip_query_params, _as_list),
+    "normalize_whitespace": (_normalize_whitespace, bool),
+    "regex_replace": (_regex_replace, _compile_regex_rules),
+}
+
+def build_pipeline(steps):
+    """解析目标配置中的 process 步骤列表, 返回 (步骤名, 处理函数, 参数) 列表"""
+    pipeline = []
+    for step in steps or []:
+        if not isinstance(step, dict) or len(step) != 1:
+            raise ValueError(f"每个处理步骤必须是只包含一个键的映射: {step}")
+        (key, value), = step.items()
+        if key not in PIPELINE_STEPS:
+            raise ValueError(f"不支持的处理步骤 '{key}'，可用步骤: {', '.join(PIPELINE_STEPS)}")
+        function, convert = PIPELINE_STEPS[key]
+        try:
+            pipeline.append((key, function, convert(value)))
+        except (re.error, TypeError) as e:
+            raise ValueError(f"处理步骤 '{key}' 的参数无效: {e}")
+    return pipeline
+
+def run_pipeline(pipeline, data):
+    """依次执行内容处理步骤"""
+    text = data.decode('utf-8', errors='replace')
+    for _, function, argument in pipeline:
+        text = function(text, argument)
+    return text.encode('utf-8')
+
+def process_content(job, body):
+    """在计算哈希之前按目标配置处理内容, 返回处理后的 ContentBody; 未配置处理时原样返回 (不读取内容)"""
+    pipeline = job.get("pipeline")
+    if not pipeline and job.get("format") != "json":
+        return body
+    display_name = job['name'] or job['url']
+    data = body.read()
+    if pipeline:
+        try:
+            data = run_pipeline(pipeline, data)
         except Exception as e:
-            print(f"::error::发送 Webhook 通知至 {url} 失败: {e}")
+            print(f"::warning::'{display_name}' 的内容处理失败，按原始内容比较: {e}")
+            return body
+    if job.get("format") == "json":
+        try:
+            data = canonicalize_json(json.loads(data.decode('utf-8')), job.get("ignore_paths", []))
+        except ValueError as e:
+            print(f"::warning::'{display_name}' 的响应不是有效的 JSON，按原始内容比较: {e}")
+            if not pipeline:
+                return body
+    processed = ContentBody.from_bytes(data)
+    processed.truncated = body.truncated
+    body.close()
+    return processed
 
-def send_email_notification(subject, changes_list, recipients):
-    """通过 BCC 向多个收件人发送单封邮件，保护隐私且高效"""
-    if not recipients:
-        print("::notice::未配置任何邮件接收人，跳过邮件通知。")
+def write_diff_report(path, diff_lines, preview_lines=MAX_DIFF_LINES):
+    """先从差异生成器中取出通知所需的预览行 (多取一行以判断是否截断), 再用同一个生成器把完整差异写入报告文件;
+    返回用于通知的截断预览"""
+    diff_lines = iter(diff_lines)
+    preview = list(itertools.islice(diff_lines, preview_lines + 1))
+    truncated = len(preview) > preview_lines
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(preview))
+        for line in diff_lines:
+            f.write("\n")
+            f.write(line)
+    truncated_diff = "\n".join(preview[:preview_lines])
+    if truncated:
+        truncated_diff += "\n... (内容已截断，请查看快照链接获取完整差异)"
+    return truncated_diff
+
+def build_history_record(timestamp_str, meta, relative_dir):
+    """根据快照元数据生成一条版本索引记录"""
+    path = meta.get("object") or f"{relative_dir}/{meta['kind']}"
+    return {
+        "timestamp": timestamp_str, "hash": meta["hash"], "kind": meta["kind"],
+        "status_code": meta.get("status_code"), "size": meta["size"], "path": path,
+    }
+
+def append_history(url_dir, record):
+    """向目标的版本索引追加一条记录"""
+    with open(os.path.join(url_dir, HISTORY_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+
+def rebuild_history(url_dir):
+    """遍历目标的版本目录重建版本索引, 仅在索引缺失或快照迁移后执行一次"""
+    safe_name = os.path.basename(os.path.normpath(url_dir))
+    records = []
+    for version in sorted(os.listdir(url_dir)):
+        change_dir = os.path.join(url_dir, version)
+        if not os.path.isdir(change_dir):
+            continue
+        meta_path = os.path.join(change_dir, SNAPSHOT_META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        else:
+            meta = None
+            for filename in LEGACY_SNAPSHOT_FILES:
+                legacy_path = os.path.join(change_dir, filename)
+                if os.path.exists(legacy_path):
+                    with open(legacy_path, "rb") as f:
+                        data = f.read()
+                    meta = {"kind": filename, "hash": get_content_hash(data), "size": len(data)}
+                    break
+            if meta is None:
+                continue
+        records.append(build_history_record(version, meta, f"{safe_name}/{version}"))
+
+    history_path = os.path.join(url_dir, HISTORY_FILE)
+    with open(f"{history_path}.tmp", "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+    os.replace(f"{history_path}.tmp", history_path)
+    return records
+
+def ensure_history(url_dir):
+    """确保目标的版本索引存在, 旧版快照目录首次使用时自动建立索引"""
+    if not os.path.exists(os.path.join(url_dir, HISTORY_FILE)):
+        rebuild_history(url_dir)
+
+def read_history_tail(url_dir, count=1):
+    """从文件末尾反向读取最近的 count 条版本记录 (按时间正序返回), 耗时与历史长度无关"""
+    history_path = os.path.join(url_dir, HISTORY_FILE)
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b""
+        while end > 0 and data.count(b"\n") <= count:
+            step = min(4096, end)
+            end -= step
+            f.seek(end)
+            data = f.read(step) + data
+    lines = [line for line in data.splitlines() if line.strip()]
+    if end > 0:
+        # 第一行可能不完整
+        lines = lines[1:]
+    return [json.loads(line) for line in lines[-count:]]
+
+def find_history_at(url_dir, timestamp_str):
+    """二分查找在指定时间点 (版本目录时间戳格式) 生效的版本记录; 不存在时返回 None"""
+    history_path = os.path.join(url_dir, HISTORY_FILE)
+    if not os.path.exists(history_path):
+        return None
+    found = None
+    with open(history_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        lo, hi = 0, f.tell()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            # 定位到位于 mid 或其后的第一个行首
+            f.seek(max(mid - 1, 0))
+            if mid:
+                f.readline()
+            line_start = f.tell()
+            line = f.readline()
+            if not line.strip():
+                hi = mid
+                continue
+            record = json.loads(line)
+            if record["timestamp"] <= timestamp_str:
+                found = record
+                lo = line_start + len(line)
+            else:
+                hi = mid
+    return found
+
+def read_history_content(record):
+    """读取版本记录对应的快照内容; 文件缺失时返回 None"""
+    path = record["path"]
+    if path.startswith(f"{OBJECTS_DIRNAME}/"):
+        return read_object(path) if os.path.exists(os.path.join(SNAPSHOT_DIR, path)) else None
+    full_path = os.path.join(SNAPSHOT_DIR, path)
+    if not os.path.exists(full_path):
+        return None
+    with open(full_path, "rb") as f:
+        return f.read()
+
+def migrate_snapshots(compression="gzip"):
+    """将旧版快照目录原地迁移为对象存储 + 元数据指针的格式"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        print(f"::warning::快照目录 {SNAPSHOT_DIR} 不存在，无需迁移。")
         return
-    smtp_host = os.environ.get("SMTP_HOST")
-    smtp_port = os.environ.get("SMTP_PORT")
-    smtp_user = os.environ.get("SMTP_USER")
-    smtp_password = os.environ.get("SMTP_PASSWORD")
-    mail_from = os.environ.get("MAIL_FROM")
-    sender_name = os.environ.get("MAIL_SENDER_NAME")
-    if not all([smtp_host, smtp_port, smtp_user, smtp_password, mail_from]):
-        print("::notice::SMTP 服务器未完全配置，跳过邮件通知。")
+    migrated, bytes_before = 0, 0
+    for target_name in sorted(os.listdir(SNAPSHOT_DIR)):
+        url_dir = os.path.join(SNAPSHOT_DIR, target_name)
+        if target_name.startswith("_") or not os.path.isdir(url_dir):
+            continue
+        migrated_before = migrated
+        for version in sorted(os.listdir(url_dir)):
+            change_dir = os.path.join(url_dir, version)
+            if not os.path.isdir(change_dir) or os.path.exists(os.path.join(change_dir, SNAPSHOT_META_FILE)):
+                continue
+            for filename in LEGACY_SNAPSHOT_FILES:
+                legacy_path = os.path.join(change_dir, filename)
+                if not os.path.exists(legacy_path):
+                    continue
+                with open(legacy_path, "rb") as f:
+                    data = f.read()
+                write_snapshot(change_dir, filename, data, get_content_hash(data), compression)
+                os.remove(legacy_path)
+                migrated += 1
+                bytes_before += len(data)
+                break
+        if migrated != migrated_before or not os.path.exists(os.path.join(url_dir, HISTORY_FILE)):
+            # 快照路径已变化, 重建版本索引
+            rebuild_history(url_dir)
+    objects_dir = os.path.join(SNAPSHOT_DIR, OBJECTS_DIRNAME)
+    bytes_after = 0
+    if os.path.isdir(objects_dir):
+        for root, _, files in os.walk(objects_dir):
+            bytes_after += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    print(f"::notice::快照迁移完成: 共迁移 {migrated} 个快照，原始大小 {bytes_before} 字节，对象存储当前大小 {bytes_after} 字节。")
+
+def build_webhook_payload(timestamp, summary):
+    """构造 Webhook 载荷, 设置了 WEBHOOK_CUSTOM_PAYLOAD 时使用自定义模板"""
+    custom_payload_str = os.environ.get("WEBHOOK_CUSTOM_PAYLOAD")
+    if custom_payload_str:
+        payload_str = custom_payload_str.replace("{timestamp}", timestamp).replace("{changes_summary}", summary)
+        return json.loads(payload_str)
+    text_content = (f"网页/API 变更监控提醒\n检测时间: {timestamp}\n\n{summary}")
+    return {"msgtype": "text", "text": {"content": text_content}}
+
+def post_webhook(url, payload):
+    """通过共享连接池向单个 Webhook 地址发送通知; 连接失败、429 与 5xx 响应按指数退避重试"""
+    session = get_http_session()
+    for attempt in range(1, WEBHOOK_RETRY_COUNT + 1):
+        try:
+            response = session.post(url, json=payload, timeout=WEBHOOK_TIMEOUT)
+            if response.status_code != 429 and response.status_code < 500:
+                if not response.ok:
+                    print(f"::error::发送 Webhook 通知至 {url} 失败: HTTP {response.status_code} {response.reason}")
+                    return False
+                print(f"Webhook 通知已发送至: {url}")
+                return True
+            error = f"HTTP {response.status_code} {response.reason}"
+        except requests.RequestException as e:
+            error = e
+        if attempt < WEBHOOK_RETRY_COUNT:
+            delay = get_retry_delay(attempt, WEBHOOK_RETRY_DELAY_SECONDS)
+            print(f"::warning::第 {attempt}/{WEBHOOK_RETRY_COUNT} 次发送 Webhook 通知至 {url} 失败: {error}，将在 {delay:.1f} 秒后重试...")
+            time.sleep(delay)
+    print(f"::error::发送 Webhook 通知至 {url} 失败: 重试 {WEBHOOK_RETRY_COUNT} 次后依然失败 ({error})")
+    return False
+
+def send_webhook_notification(webhook_urls_str, timestamp, summary):
+    """并发向多个 Webhook 地址发送通知, 单个地址响应缓慢不会拖慢其他地址"""
+    if not webhook_urls_str:
         return
-    
-    plain_text_parts = []
-    for change in changes_list:
-        display_name = f"{change['name']} ({change['url']})" if change.get('name') else change['url']
-        part = (f"监控目标: {display_name}\n变更时间: {change['timestamp']}\n查看快照: {change['snapshot_url']}\n\n变更内容:\n---\n{change['diff']}\n---")
-        plain_text_parts.append(part)
-    plain_body = "\n\n".join(plain_text_parts)
+    urls = [url.strip() for url in webhook_urls_str.split(',') if url.strip()]
+    if not urls:
+        return
+    try:
+        payload = build_webhook_payload(timestamp, summary)
+    except ValueError as e:
+        print(f"::error::WEBHOOK_CUSTOM_PAYLOAD 不是有效的 JSON，跳过 Webhook 通知: {e}")
+        return
+    with ThreadPoolExecutor(max_workers=min(len(urls), WEBHOOK_MAX_CONCURRENCY)) as executor:
+        list(executor.map(lambda url: post_webhook(url, payload), urls))
+
+def get_smtp_config():
+    """读取 SMTP 相关环境变量, 未完全配置时返回 None"""
+    config = {
+        "host": os.environ.get("SMTP_HOST"),
+        "port": os.environ.get("SMTP_PORT"),
+        "user": os.environ.get("SMTP_USER"),
+        "password": os.environ.get("SMTP_PASSWORD"),
+        "mail_from": os.environ.get("MAIL_FROM"),
+        "sender_name": os.environ.get("MAIL_SENDER_NAME"),
+        # ssl (默认, 如 465 端口) / starttls (如 587 端口) / none (仅用于本地调试)
+        "security": (os.environ.get("SMTP_SECURITY") or "ssl").lower(),
+    }
+    if not all([config["host"], config["port"], config["user"], config["password"], config["mail_from"]]):
+        return None
+    return config
 
+def open_smtp_connection(config):
+    """建立并认证一个 SMTP 连接"""
+    if config["security"] == "ssl":
+        server = smtplib.SMTP_SSL(config["host"], int(config["port"]), context=ssl.create_default_context(), timeout=SMTP_TIMEOUT)
+    else:
+        server = smtplib.SMTP(config["host"], int(config["port"]), timeout=SMTP_TIMEOUT)
+        if config["security"] == "starttls":
+            server.starttls(context=ssl.create_default_context())
+    try:
+        server.login(config["user"], config["password"])
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def build_email_message(subject, changes_list, config):
+    """构造同时包含纯文本与 HTML 版本的通知邮件"""
+    plain_text_parts = []
     html_content_parts = []
     for change in changes_list:
-        display_name = f"{change['name']} <span class='url-display'>({change['url']})</span>" if change.get('name') else f"<a href='{change['url']}' class='link'>{change['url']}</a>"
+        display_name = f"{change['name']} ({change['url']})" if change.get('name') else change['url']
+        plain_text_parts.append(f"监控目标: {display_name}\n变更时间: {change['timestamp']}\n查看快照: {change['snapshot_url']}\n\n变更内容:\n---\n{change['diff']}\n---")
+        html_display_name = f"{change['name']} <span class='url-display'>({change['url']})</span>" if change.get('name') else f"<a href='{change['url']}' class='link'>{change['url']}</a>"
         diff_html = change['diff'].replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\n', '<br>')
-        part = f"""
-        <div class="change-block">
-            <p><strong>监控目标:</strong> {display_name}</p>
-            <p><strong>变更时间:</strong> {change['timestamp']}</p>
-            <p><strong>查看快照:</strong> <a href="{change['snapshot_url']}" class="link">在 GitHub 上查看</a></p>
-            <div class="diff-box">
-                <strong class="diff-title">变更内容:</strong>
-                {diff_html}
-            </div>
-        </div>
-        """
-        html_content_parts.append(part)
-    html_body_content = "".join(html_content_parts)
-
-    html_template = f"""
-    <!DOCTYPE html><html lang="zh-CN"><head><meta charset="UTF-8"><title>{subject}</title><style>
-      body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif; line-height: 1.6; color: #333333; background-color: #f7f8fa; margin: 0; padding: 0; }}
-      .container {{ max-width: 680px; margin: 20px auto; padding: 30px; border-radius: 8px; background-color: #ffffff; border: 1px solid #e9e9e9; }}
-      .header {{ font-size: 24px; font-weight: 600; color: #2c3e50; margin-bottom: 25px; padding-bottom: 20px; border-bottom: 1px solid #eeeeee; text-align: center; }}
-      .change-block {{ margin-bottom: 25px; padding: 20px; border-radius: 6px; border: 1px solid #dfe6e9; border-left: 4px solid #3498db; }}
-      .change-block p {{ margin: 0 0 8px; font-size: 14px; color: #555555; }}
-      .link {{ color: #3498db; text-decoration: none; }}.link:hover {{ text-decoration: underline; }}
-      .url-display {{ color: #7f8c8d; }}
-      .diff-box {{ background-color: #fdfdfd; padding: 15px; margin-top: 15px; border-radius: 5px; font-family: 'Courier New', Courier, monospace; font-size: 12px; line-height: 1.5; white-space: pre-wrap; word-wrap: break-word; border: 1px solid #f0f0f0; }}
-      .diff-title {{ font-family: -apple-system, sans-serif; display: block; margin-bottom: 10px; font-size: 13px; color: #333; font-weight: 600; }}
-      .footer {{ margin-top: 30px; font-size: 12px; text-align: center; color: #999999; }}
-    </style></head><body><div class="container"><div class="header">{subject}</div><div class="content">{html_body_content}</div><div class="footer"><p>此邮件由 GitHub Actions 自动发送。</p></div></div></body></html>
-    """
+        html_content_parts.append(EMAIL_CHANGE_BLOCK_TEMPLATE.format(
+            display_name=html_display_name, timestamp=change['timestamp'], snapshot_url=change['snapshot_url'], diff_html=diff_html))
+    plain_body = "\n\n".join(plain_text_parts)
+    html_body = EMAIL_HTML_TEMPLATE.format(subject=subject, content="".join(html_content_parts))
 
     message = MIMEMultipart("alternative")
     message["Subject"] = Header(subject, 'utf-8')
-    if sender_name:
-        message["From"] = formataddr((Header(sender_name, 'utf-8').encode(), mail_from))
+    if config["sender_name"]:
+        message["From"] = formataddr((Header(config["sender_name"], 'utf-8').encode(), config["mail_from"]))
     else:
-        message["From"] = mail_from
-    
+        message["From"] = config["mail_from"]
+
     # **FIX**: The 'To' header is for display purposes in a BCC-only email.
     # It should be a single, valid, but generic address.
     # Setting it to the sender's own address is a common and safe practice.
     message["To"] = "noreply1@hk256.top"
 
     message.attach(MIMEText(plain_body, "plain", "utf-8"))
-    message.attach(MIMEText(html_template, "html", "utf-8"))
+    message.attach(MIMEText(html_body, "html", "utf-8"))
+    return message
 
+def send_email_notification(subject, changes_list, recipients):
+    """通过 BCC 向多个收件人发送单封邮件，保护隐私且高效"""
+    if not recipients:
+        print("::notice::未配置任何邮件接收人，跳过邮件通知。")
+        return
+    config = get_smtp_config()
+    if not config:
+        print("::notice::SMTP 服务器未完全配置，跳过邮件通知。")
+        return
+
+    message = build_email_message(subject, changes_list, config)
     try:
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(smtp_host, int(smtp_port), context=context) as server:
-            server.login(smtp_user, smtp_password)
+        with open_smtp_connection(config) as server:
             # sendmail's second argument is the list of actual recipients for BCC
-            server.sendmail(mail_from, recipients, message.as_string())
-            print(f"邮件通知已通过 BCC 发送给 {len(recipients)} 个收件人。")
+            server.sendmail(config["mail_from"], recipients, message.as_string())
+        print(f"邮件通知已通过 BCC 发送给 {len(recipients)} 个收件人。")
     except Exception as e:
         print(f"::error::发送邮件失败: {e}")
 
+def get_mail_recipients():
+    """读取去重后的邮件接收人列表"""
+    recipients = []
+    mail_recipients_var = os.environ.get("MAIL_RECIPIENTS")
+    if mail_recipients_var:
+        recipients.extend([email.strip() for email in mail_recipients_var.split(',') if email.strip()])
+    return sorted(list(set(recipients)))
+
 def send_manual_notification(title, body):
     """构造并发送一条用户自定义的通知"""
     print(f"::notice::正在发送自定义通知: {title}")
@@ -231,12 +1789,7 @@ def send_manual_notification(title, body):
         print("::notice::未配置 WEBHOOK_URL，跳过 Webhook 通知。")
 
     # Send Email
-    recipients = []
-    mail_recipients_var = os.environ.get("MAIL_RECIPIENTS")
-    if mail_recipients_var:
-        recipients.extend([email.strip() for email in mail_recipients_var.split(',') if email.strip()])
-    unique_recipients = sorted(list(set(recipients)))
-    
+    unique_recipients = get_mail_recipients()
     if unique_recipients:
         send_email_notification(title, change_list, unique_recipients)
     else:
@@ -244,22 +1797,378 @@ def send_manual_notification(title, body):
     
     print("::notice::自定义通知发送流程完毕。")
 
-def main():
-    """脚本主逻辑函数"""
+def process_fetch_result(job, fetched, settings, repo_full_name):
+    """对单个目标的抓取结果进行哈希比对, 保存快照与差异报告
+    返回 (检查结果, 变更): 检查结果为 changed / unchanged / error / skipped, 变更为需要通知的内容或 None"""
+    content = fetched["content"]
+    display_name = job["name"] or job["url"]
+    print(f"正在检查 '{display_name}'...")
+    if fetched.get("skipped"):
+        print(f"::warning title=已跳过::{display_name} {fetched['skipped']}")
+        return "skipped", None
+    if content is None:
+        # 304 Not Modified: 无需哈希、比对与写盘
+        print(f"::notice title=无变化::{display_name} (304 Not Modified)")
+        return "unchanged", None
+    timings = fetched.setdefault("timings", {})
+    started = time.perf_counter()
+    try:
+        with collect_stage_times(timings):
+            return persist_fetch_result(job, fetched, settings, repo_full_name, display_name)
+    finally:
+        # 写入阶段不含差异计算
+        timings["persist"] = timings.get("persist", 0.0) + time.perf_counter() - started - timings.get("diff", 0.0)
+        content.close()
+
+def persist_fetch_result(job, fetched, settings, repo_full_name, display_name):
+    """比对内容哈希, 发生变化时写入快照、差异报告与最新哈希"""
+    name, type, target_url, safe_name = job["name"], job["type"], job["url"], job["safe_name"]
+    content, is_error, status_code = fetched["content"], fetched["is_error"], fetched["status_code"]
+    notify_status_codes = settings.get("notify_http_status_codes", [])
+    url_dir = os.path.join(SNAPSHOT_DIR, safe_name)
+    if not os.path.exists(url_dir):
+        os.makedirs(url_dir)
+
+    current_hash = content.hash
+    last_hash = read_latest_hash(url_dir)
+
+    # 检查是否需要发送错误通知
+    should_notify_error = False
+    if is_error and status_code and notify_status_codes and status_code in notify_status_codes:
+        should_notify_error = True
+        print(f"::notice title=需要提醒的错误::{display_name} 遇到需要提醒的HTTP状态码 {status_code}，将发送通知")
+
+    # 只有当内容发生变化时才处理（包括需要提醒的错误）
+    if current_hash != last_hash:
+        print(f"::notice title=检测到变化::{display_name}")
+        now = datetime.now(CST_TZ)
+        timestamp_str = now.strftime(VERSION_TIMESTAMP_FORMAT)
+        change_dir = os.path.join(url_dir, timestamp_str)
+        ensure_history(url_dir)
+        previous = read_history_tail(url_dir)
+        os.makedirs(change_dir)
+
+        if is_error: snapshot_filename = "error.txt"
+        elif type == "url": snapshot_filename = "snapshot.html"
+        else: snapshot_filename = "response.txt"
+
+        meta = write_snapshot(change_dir, snapshot_filename, content, current_hash, get_compression(settings),
+                              status_code if is_error else None, content.truncated)
+        append_history(url_dir, build_history_record(timestamp_str, meta, f"{safe_name}/{timestamp_str}"))
+
+        with timed_stage("diff"):
+            diff_lines = ["新目标，无历史版本可比较。"]
+            if last_hash and previous:
+                old_content = read_history_content(previous[-1])
+                if old_content is not None:
+                    diff_lines = iter_content_diff(job, old_content, content.read())
+            truncated_diff = write_diff_report(os.path.join(change_dir, "diff.txt"), diff_lines)
+
+        write_latest_hash(url_dir, current_hash)
+        # 错误状态没有可用的校验信息, 清除旧记录以免下次收到 304 而误判为无变化
+        save_validators(url_dir, None if is_error else fetched["validators"])
+
+        snapshot_url = ""
+        if repo_full_name:
+            snapshot_url = f"https://github.com/{repo_full_name}/tree/main/{change_dir.replace(os.sep, '/')}"
+
+        # 只有当需要提醒的错误或者不是错误状态时才添加到变更列表
+        if should_notify_error or not is_error:
+            return "changed", {
+                "name": name, "url": target_url,
+                "timestamp": now.strftime('%Y-%m-%d %H:%M:%S %Z'),
+                "snapshot_url": snapshot_url, "diff": truncated_diff, "seq": job["seq"]
+            }
+        return "changed", None
+    elif is_error:
+        # 遇到不需要提醒的错误时，不更新最新哈希值，保持上次正常状态
+        print(f"::notice::{display_name} 遇到不需要提醒的错误，保持上次正常状态")
+        return "error", None
+    else:
+        save_validators(url_dir, fetched["validators"])
+        print(f"::notice title=无变化::{display_name}")
+        return "unchanged", None
+
+def load_config():
+    """读取并解析配置文件, 返回 (目标列表, 全局配置); 文件缺失或格式错误时抛出异常"""
+    with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    return config.get("targets", []) or [], config.get("settings", {}) or {}
+
+def build_fetch_jobs(targets, settings):
+    """为所有有效的监控目标生成抓取任务"""
+    jobs = []
+    for seq, target in enumerate(targets):
+        job = build_fetch_job(seq, target, settings)
+        if job:
+            jobs.append(job)
+    return jobs
+
+def check_targets(jobs, settings, repo_full_name, breaker=None, deadline=None, metrics=None):
+    """并发抓取并按配置顺序处理一批目标, 返回 (需要通知的变更列表, 各目标的检查结果)"""
+    all_changes = []
+    outcomes = {}
+    started = time.perf_counter()
+    fetched_results = run_fetch_jobs(jobs, settings, breaker, deadline)
+    for job, fetched in iter_results_in_order(jobs, fetched_results):
+        outcome, change = process_fetch_result(job, fetched, settings, repo_full_name)
+        outcomes[job["safe_name"]] = outcome
+        if metrics:
+            metrics.record_target(job, fetched, outcome)
+        if change:
+            all_changes.append(change)
+    if metrics:
+        metrics.add_run_stage("check", time.perf_counter() - started)
+    return all_changes, outcomes
+
+def notify_changes(all_changes):
+    """汇总一批变更, 并发发送 Webhook 通知, 同时通过一个已认证的 SMTP 连接发送邮件通知; 返回各通知渠道的耗时"""
+    summary_parts = []
+    for change in all_changes:
+        display_name = f"{change['name']} ({change['url']})" if change.get('name') else change['url']
+        part = (f"监控目标: {display_name}\n变更时间: {change['timestamp']}\n查看快照: {change['snapshot_url']}\n\n变更内容:\n---\n{change['diff']}\n---")
+        summary_parts.append(part)
+
+    summary_for_webhook = "\n\n".join(summary_parts)
+    now_str = datetime.now(CST_TZ).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+    print("\n--- 变更摘要 ---")
+    print(summary_for_webhook)
+
+    timings = {}
+
+    def send_webhooks():
+        started = time.perf_counter()
+        send_webhook_notification(os.environ.get("WEBHOOK_URL"), now_str, summary_for_webhook)
+        timings["notify_webhook"] = time.perf_counter() - started
+
+    # Webhook 与邮件互不等待
+    webhook_thread = threading.Thread(target=send_webhooks)
+    webhook_thread.start()
+    try:
+        started = time.perf_counter()
+        email_subject = f"网页/API 变更监控提醒 ({now_str})"
+        send_email_notification(email_subject, all_changes, get_mail_recipients())
+        timings["notify_email"] = time.perf_counter() - started
+    finally:
+        webhook_thread.join()
+    return timings
+
+class NotificationDispatcher:
+    """后台通知发送器: 提交变更后立即返回, 不阻塞监控流程;
+    合并窗口 (秒) 内陆续到达的变更合并为一批发送, close() 时立即发送剩余变更并等待发送完成"""
+
+    def __init__(self, coalesce_seconds=0):
+        self.coalesce_seconds = float(coalesce_seconds or 0)
+        # 各通知渠道的累计耗时 (秒)
+        self.timings = defaultdict(float)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, changes):
+        """提交一组需要通知的变更"""
+        if changes:
+            self.queue.put(list(changes))
+
+    def close(self):
+        """发送剩余的变更并等待后台线程结束"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = list(item)
+            deadline = time.monotonic() + self.coalesce_seconds
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.extend(item)
+            try:
+                for stage, seconds in notify_changes(batch).items():
+                    self.timings[stage] += seconds
+            except Exception as e:
+                print(f"::error::发送通知失败: {e}")
+
+class RunMetrics:
+    """一次运行中各目标、各阶段的耗时与响应大小"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        self.targets = []
+        self.run_stages = defaultdict(float)
+
+    def record_target(self, job, fetched, outcome):
+        stages = dict(fetched.get("timings") or {})
+        self.targets.append({
+            "seq": job["seq"], "name": job["name"] or job["url"], "url": job["url"], "host": job["host"], "safe_name": job["safe_name"],
+            "outcome": outcome, "attempts": fetched.get("attempts", 0), "status_code": fetched.get("status_code"),
+            "bytes": fetched.get("bytes", 0), "stages": stages,
+            "total": sum(stages.get(stage, 0.0) for stage in TARGET_TOTAL_STAGES),
+        })
+
+    def add_run_stage(self, stage, seconds):
+        self.run_stages[stage] += seconds
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+def get_metrics_settings(settings):
+    """获取运行指标的导出配置"""
+    options = dict(DEFAULT_METRICS)
+    options.update(settings.get("metrics") or {})
+    return options
+
+def write_metrics_jsonl(metrics, path):
+    """以 JSON Lines 追加写入本次运行的指标: 每个目标一行, 最后一行为整体运行的汇总"""
+    run_id = datetime.fromtimestamp(metrics.started_at, CST_TZ).isoformat(timespec="seconds")
+    with open(path, "a", encoding="utf-8") as f:
+        for target in metrics.targets:
+            record = {"type": "target", "run": run_id, **{k: v for k, v in target.items() if k != "stages"}}
+            record.update({stage: round(seconds, 6) for stage, seconds in target["stages"].items()})
+            f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+        record = {"type": "run", "run": run_id, "duration": round(metrics.duration, 6), "targets": len(metrics.targets)}
+        record.update({stage: round(seconds, 6) for stage, seconds in metrics.run_stages.items()})
+        f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+
+def escape_prometheus_label(value):
+    """转义 Prometheus 标签值中的反斜杠、双引号与换行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_prometheus_textfile(metrics, path, last_known=None):
+    """以 Prometheus 文本格式原子地写入指标, 供 node_exporter 的 textfile collector 采集
+    last_known 跨多次导出保存各目标 (按 safe_name) 与运行级阶段的最近一次记录, 守护进程每次都写出全部目标"""
+    last_known = last_known if last_known is not None else {}
+    known_targets = last_known.setdefault("targets", {})
+    known_targets.update((target["safe_name"], target) for target in metrics.targets)
+    run_stages = last_known.setdefault("run_stages", {})
+    run_stages.update(metrics.run_stages)
+    targets = sorted(known_targets.values(), key=lambda target: target["seq"])
+    lines = [
+        "# HELP webmonitor_target_stage_seconds Time spent in each stage of the last check of a target.",
+        "# TYPE webmonitor_target_stage_seconds gauge",
+    ]
+    for target in targets:
+        label = escape_prometheus_label(target["name"])
+        for stage, seconds in sorted(target["stages"].items()):
+            lines.append(f'webmonitor_target_stage_seconds{{target="{label}",stage="{stage}"}} {seconds:.6f}')
+    lines += ["# HELP webmonitor_target_response_bytes Response body size of the last check of a target.",
+              "# TYPE webmonitor_target_response_bytes gauge"]
+    lines += [f'webmonitor_target_response_bytes{{target="{escape_prometheus_label(t["name"])}"}} {t["bytes"]}' for t in targets]
+    lines += ["# HELP webmonitor_target_attempts Fetch attempts in the last check of a target.",
+              "# TYPE webmonitor_target_attempts gauge"]
+    lines += [f'webmonitor_target_attempts{{target="{escape_prometheus_label(t["name"])}"}} {t["attempts"]}' for t in targets]
+    outcomes = defaultdict(int)
+    for target in targets:
+        outcomes[target["outcome"]] += 1
+    lines += ["# HELP webmonitor_targets Targets by outcome in the last run.", "# TYPE webmonitor_targets gauge"]
+    lines += [f'webmonitor_targets{{outcome="{outcome}"}} {count}' for outcome, count in sorted(outcomes.items())]
+    lines += ["# HELP webmonitor_run_stage_seconds Time spent in run-level stages of the last run.",
+              "# TYPE webmonitor_run_stage_seconds gauge"]
+    lines += [f'webmonitor_run_stage_seconds{{stage="{stage}"}} {seconds:.6f}' for stage, seconds in sorted(run_stages.items())]
+    lines += ["# HELP webmonitor_run_duration_seconds Wall time of the last run.", "# TYPE webmonitor_run_duration_seconds gauge",
+              f"webmonitor_run_duration_seconds {metrics.duration:.6f}",
+              "# HELP webmonitor_run_timestamp_seconds Start time of the last run.", "# TYPE webmonitor_run_timestamp_seconds gauge",
+              f"webmonitor_run_timestamp_seconds {metrics.started_at:.3f}"]
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(f"{path}.tmp", path)
+
+def format_seconds(seconds):
+    """步骤摘要中的耗时显示"""
+    return f"{seconds:.3f}" if seconds else "-"
+
+def build_step_summary(metrics, top=10):
+    """生成 Markdown 格式的耗时摘要: 最慢的目标与各阶段的累计耗时"""
+    outcomes = defaultdict(int)
+    for target in metrics.targets:
+        outcomes[target["outcome"]] += 1
+    counts = "，".join(f"{outcome} {count}" for outcome, count in sorted(outcomes.items()))
+    lines = ["### 监控运行耗时", "",
+             f"共检查 {len(metrics.targets)} 个目标 ({counts or '无'})，总耗时 {metrics.duration:.2f} 秒。", ""]
+    stages = ("connect", "ttfb", "transfer", "hash", "process", "diff", "persist")
+    slowest = sorted(metrics.targets, key=lambda target: target["total"], reverse=True)[:top]
+    if slowest:
+        lines.append(f"#### 最慢的 {len(slowest)} 个目标 (秒)")
+        lines.append("")
+        lines.append("| 目标 | 结果 | 尝试次数 | 总耗时 | " + " | ".join(STAGE_LABELS[stage] for stage in stages) + " | 大小 (字节) |")
+        lines.append("|" + " --- |" * (len(stages) + 5))
+        for target in slowest:
+            name = target["name"].replace("|", "\\|")
+            cells = [format_seconds(target["stages"].get(stage, 0.0)) for stage in stages]
+            lines.append(f"| {name} | {target['outcome']} | {target['attempts']} | {format_seconds(target['total'])} | " + " | ".join(cells) + f" | {target['bytes']} |")
+        lines.append("")
+    lines += ["#### 各阶段耗时 (秒)", "", "| 阶段 | 累计 | 最大 | 最慢的目标 |", "| --- | --- | --- | --- |"]
+    for stage in stages:
+        values = [(target["stages"].get(stage, 0.0), target["name"]) for target in metrics.targets]
+        if not any(seconds for seconds, _ in values):
+            continue
+        longest, longest_name = max(values)
+        longest_name = longest_name.replace("|", "\\|")
+        lines.append(f"| {STAGE_LABELS[stage]} | {format_seconds(sum(seconds for seconds, _ in values))} | {format_seconds(longest)} | {longest_name} |")
+    for stage, seconds in sorted(metrics.run_stages.items()):
+        lines.append(f"| {STAGE_LABELS.get(stage, stage)} | {format_seconds(seconds)} | - | - |")
+    return "\n".join(lines) + "\n"
+
+def export_metrics(metrics, settings, last_known=None):
+    """按配置导出本次运行的指标; 导出失败只记录警告, 不影响监控结果; last_known 见 write_prometheus_textfile"""
+    metrics.finish()
+    options = get_metrics_settings(settings)
+    try:
+        if options["jsonl_file"]:
+            write_metrics_jsonl(metrics, options["jsonl_file"])
+        if options["prometheus_file"]:
+            write_prometheus_textfile(metrics, options["prometheus_file"], last_known)
+        if options["step_summary"] and os.environ.get("GITHUB_STEP_SUMMARY"):
+            with open(os.environ["GITHUB_STEP_SUMMARY"], "a", encoding="utf-8") as f:
+                f.write(build_step_summary(metrics, int(options["summary_top"])))
+    except OSError as e:
+        print(f"::warning::导出运行指标失败: {e}")
+
+def prepare_run():
+    """检查运行环境并创建快照目录, 返回仓库名称"""
     repo_full_name = os.environ.get("GITHUB_REPOSITORY")
     if not repo_full_name:
         print("::warning::未找到 GITHUB_REPOSITORY 环境变量，无法生成快照链接。")
     if not os.path.exists(SNAPSHOT_DIR):
         os.makedirs(SNAPSHOT_DIR)
+    return repo_full_name
+
+def finish_run(all_changes, metrics=None):
+    """将本次运行的变更作为一批通知发送, 并向 GITHUB_OUTPUT 写入提交信息"""
+    if not all_changes:
+        return
+    dispatcher = NotificationDispatcher()
+    dispatcher.submit(all_changes)
+    now_for_commit = datetime.now(CST_TZ).strftime('%Y-%m-%d %H:%M')
+    commit_message = f"【自动监控】内容发生变化 ({now_for_commit})"
+    if 'GITHUB_OUTPUT' in os.environ:
+        with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
+            f.write('changes_detected=true\n')
+            f.write(f'commit_message={commit_message}\n')
+    dispatcher.close()
+    if metrics:
+        for stage, seconds in dispatcher.timings.items():
+            metrics.add_run_stage(stage, seconds)
+
+def main(shard=None, bundle_dir=None):
+    """脚本主逻辑函数; 指定分片时只检查属于该分片的目标, 并将结果写入结果包而不发送通知"""
+    metrics = RunMetrics()
+    repo_full_name = prepare_run()
 
     try:
-        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-            targets = config.get("targets", [])
-            settings = config.get("settings", {})
-            retry_count = settings.get("retry_count", 3)
-            retry_delay = settings.get("retry_delay_seconds", 5)
-            notify_status_codes = settings.get("notify_http_status_codes", [])
+        targets, settings = load_config()
     except FileNotFoundError:
         print(f"::error::错误: 未找到配置文件 {CONFIG_FILE}。")
         sys.exit(1)
@@ -267,155 +2176,528 @@ def main():
         print(f"::error::错误: 配置文件 {CONFIG_FILE} 格式不正确: {e}")
         sys.exit(1)
 
-    all_changes = []
-    for target in targets:
-        name = target.get("name")
-        type = target.get("type")
-        target_url, content, is_error, status_code = None, None, False, None
-        if type == "url":
-            target_url = target.get("value")
-            if not target_url:
-                print(f"::warning::类型为 'url' 的目标缺少 'value' 字段，已跳过。")
-                continue
-            content, is_error, status_code = fetch_content_from_url(target_url, retry_count, retry_delay, notify_status_codes)
-        elif type == "curl":
-            command = target.get("command")
-            if not command:
-                print(f"::warning::类型为 'curl' 的目标缺少 'command' 字段，已跳过。")
-                continue
-            target_url = extract_url_from_curl(command)
-            if not target_url:
-                print(f"::error::无法从 curl 命令中解析出 URL，请检查命令: [{command}]")
-                continue
-            content, is_error, status_code = fetch_content_from_curl(command, retry_count, retry_delay)
+    jobs = build_fetch_jobs(targets, settings)
+    if shard:
+        jobs = select_shard_jobs(jobs, shard)
+    shard_jobs = jobs
+    adaptive = get_adaptive_settings(settings)
+    schedule_state = {}
+    if adaptive:
+        schedule_state = load_state(SCHEDULE_STATE_FILE)
+        jobs = select_due_jobs(jobs, schedule_state, adaptive, time.time())
+    breaker_state = load_state(BREAKER_STATE_FILE)
+    breaker = get_circuit_breaker(settings, breaker_state)
+    deadline = None
+    if settings.get("run_deadline_seconds"):
+        deadline = time.monotonic() + float(settings["run_deadline_seconds"])
+    all_changes, outcomes = check_targets(jobs, settings, repo_full_name, breaker, deadline, metrics)
+    if breaker:
+        save_state(BREAKER_STATE_FILE, breaker_state)
+    if adaptive:
+        update_adaptive_state(jobs, outcomes, schedule_state, adaptive, time.time())
+        save_state(SCHEDULE_STATE_FILE, schedule_state)
+
+    if shard:
+        write_shard_bundle(bundle_dir, shard, shard_jobs, outcomes, all_changes, schedule_state, breaker_state)
+    else:
+        finish_run(all_changes, metrics)
+    export_metrics(metrics, settings)
+
+def parse_shard(value):
+    """解析 --shard 参数 'i/N', i 从 0 开始"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value)
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise argparse.ArgumentTypeError(f"无效的分片 '{value}'，格式应为 i/N 且 0 <= i < N")
+    return int(match.group(1)), int(match.group(2))
+
+def get_job_shard(job, shard_count):
+    """按主机的哈希值确定目标所属的分片: 结果与运行环境无关, 且同一主机的目标总在同一分片,
+    单主机并发限制与熔断状态因此仍在一个分片内生效"""
+    key = job["host"] or job["safe_name"]
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return int(digest[:16], 16) % shard_count
+
+def select_shard_jobs(jobs, shard):
+    """挑选属于指定分片的抓取任务"""
+    index, count = shard
+    selected = [job for job in jobs if get_job_shard(job, count) == index]
+    print(f"::notice::分片 {index}/{count}: 共 {len(jobs)} 个目标，本分片检查其中 {len(selected)} 个。")
+    return selected
+
+def collect_bundle_files(jobs, outcomes):
+    """收集本次运行中各目标写入或删除的快照文件 (相对于 SNAPSHOT_DIR), 返回 (写入的文件, 删除的文件)"""
+    files, deleted = set(), set()
+    for job in jobs:
+        outcome = outcomes.get(job["safe_name"])
+        if outcome not in ("changed", "unchanged"):
+            continue
+        safe_name = job["safe_name"]
+        url_dir = os.path.join(SNAPSHOT_DIR, safe_name)
+        validators_path = f"{safe_name}/{VALIDATORS_FILE}"
+        if os.path.exists(os.path.join(SNAPSHOT_DIR, validators_path)):
+            files.add(validators_path)
         else:
-            print(f"::warning::不支持的类型 '{type}'，目标 '{name or '未命名'}' 已跳过。")
+            deleted.add(validators_path)
+        if outcome != "changed":
+            continue
+        files.update([f"{safe_name}/latest.hash", f"{safe_name}/{HISTORY_FILE}"])
+        latest = read_history_tail(url_dir)[-1]
+        for filename in os.listdir(os.path.join(url_dir, latest["timestamp"])):
+            files.add(f"{safe_name}/{latest['timestamp']}/{filename}")
+        if latest["path"].startswith(f"{OBJECTS_DIRNAME}/"):
+            files.add(latest["path"])
+    return sorted(files), sorted(deleted)
+
+def write_shard_bundle(bundle_dir, shard, jobs, outcomes, all_changes, schedule_state, breaker_state):
+    """将分片的运行结果写入结果包: bundle.json 记录变更、最新哈希与跨运行状态, snapshots/ 中为写入的快照文件副本"""
+    index, count = shard
+    files, deleted = collect_bundle_files(jobs, outcomes)
+    files_dir = os.path.join(bundle_dir, BUNDLE_SNAPSHOTS_DIRNAME)
+    os.makedirs(bundle_dir, exist_ok=True)
+    if os.path.isdir(files_dir):
+        shutil.rmtree(files_dir)
+    for relative_path in files:
+        destination = os.path.join(files_dir, relative_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(os.path.join(SNAPSHOT_DIR, relative_path), destination)
+
+    safe_names = {job["safe_name"] for job in jobs}
+    hosts = sorted({job["host"] for job in jobs})
+    bundle = {
+        "shard": index, "shards": count,
+        "created_at": datetime.now(CST_TZ).isoformat(timespec="seconds"),
+        "targets": sorted(safe_names),
+        "outcomes": {name: outcome for name, outcome in outcomes.items() if name in safe_names},
+        "hashes": {job["safe_name"]: read_latest_hash(os.path.join(SNAPSHOT_DIR, job["safe_name"]))
+                   for job in jobs if outcomes.get(job["safe_name"]) == "changed"},
+        "changes": all_changes,
+        "files": files, "deleted": deleted,
+        "schedule": {name: entry for name, entry in schedule_state.items() if name in safe_names},
+        "hosts": hosts,
+        "breakers": {host: entry for host, entry in breaker_state.items() if host in hosts},
+    }
+    with open(os.path.join(bundle_dir, BUNDLE_FILE), "w", encoding="utf-8") as f:
+        json.dump(bundle, f, ensure_ascii=False, sort_keys=True, indent=2)
+    print(f"::notice::分片 {index}/{count} 的结果包已写入 {bundle_dir}: {len(all_changes)} 个变更，{len(files)} 个快照文件。")
+
+def resolve_bundle_path(relative_path):
+    """将结果包中的相对路径解析为 SNAPSHOT_DIR 下的路径, 拒绝越出快照目录的路径"""
+    normalized = os.path.normpath(relative_path)
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith(f"..{os.sep}"):
+        raise ValueError(f"结果包中的路径无效: {relative_path}")
+    return os.path.join(SNAPSHOT_DIR, normalized)
+
+def merge_shard_bundles(bundle_dirs):
+    """合并各分片的结果包: 写入快照文件并合并跨运行状态, 然后像一次完整运行一样发送一批通知并输出提交信息"""
+    prepare_run()
+    bundles = []
+    for bundle_dir in bundle_dirs:
+        try:
+            with open(os.path.join(bundle_dir, BUNDLE_FILE), "r", encoding="utf-8") as f:
+                bundles.append((bundle_dir, json.load(f)))
+        except (OSError, ValueError) as e:
+            print(f"::error::无法读取结果包 {bundle_dir}: {e}")
+            sys.exit(1)
+    shard_counts = {bundle["shards"] for _, bundle in bundles}
+    indexes = [bundle["shard"] for _, bundle in bundles]
+    if len(shard_counts) != 1 or len(set(indexes)) != len(indexes):
+        print(f"::error::结果包的分片信息不一致: {sorted(indexes)} (分片总数 {sorted(shard_counts)})")
+        sys.exit(1)
+    missing = sorted(set(range(shard_counts.pop())) - set(indexes))
+    if missing:
+        print(f"::warning::缺少分片 {missing} 的结果包，这些分片中的目标本次不会更新。")
+
+    schedule_state = load_state(SCHEDULE_STATE_FILE)
+    breaker_state = load_state(BREAKER_STATE_FILE)
+    all_changes = []
+    for bundle_dir, bundle in sorted(bundles, key=lambda item: item[1]["shard"]):
+        files_dir = os.path.join(bundle_dir, BUNDLE_SNAPSHOTS_DIRNAME)
+        for relative_path in bundle["files"]:
+            destination = resolve_bundle_path(relative_path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(os.path.join(files_dir, relative_path), destination)
+        for relative_path in bundle["deleted"]:
+            path = resolve_bundle_path(relative_path)
+            if os.path.exists(path):
+                os.remove(path)
+        schedule_state.update(bundle["schedule"])
+        for host in bundle["hosts"]:
+            breaker_state.pop(host, None)
+        breaker_state.update(bundle["breakers"])
+        all_changes.extend(bundle["changes"])
+        print(f"已合并分片 {bundle['shard']}/{bundle['shards']}: {len(bundle['files'])} 个快照文件，{len(bundle['changes'])} 个变更。")
+    save_state(SCHEDULE_STATE_FILE, schedule_state)
+    save_state(BREAKER_STATE_FILE, breaker_state)
+
+    all_changes.sort(key=lambda change: change["seq"])
+    print(f"::notice::共合并 {len(bundles)} 个结果包，{len(all_changes)} 个变更。")
+    finish_run(all_changes)
+
+def load_state(filename):
+    """读取 STATE_DIR 中的状态文件, 不存在或损坏时返回空字典"""
+    try:
+        with open(os.path.join(STATE_DIR, filename), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(filename, state):
+    """原子地写入 STATE_DIR 中的状态文件"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, filename)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, sort_keys=True, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def get_adaptive_settings(settings):
+    """获取自适应轮询配置, 未启用时返回 None"""
+    adaptive = dict(DEFAULT_ADAPTIVE_POLLING)
+    adaptive.update(settings.get("adaptive_polling") or {})
+    return adaptive if adaptive["enabled"] else None
+
+def get_min_interval(job, adaptive):
+    """目标的最短轮询间隔: 目标配置的 interval 优先"""
+    return float(job["target"].get("interval", adaptive["min_interval_seconds"]))
+
+def estimate_interval_from_history(job, adaptive):
+    """根据快照历史中的变更时间估算初始轮询间隔: 取最近变更间隔中位数的一半"""
+    min_interval = get_min_interval(job, adaptive)
+    url_dir = os.path.join(SNAPSHOT_DIR, job["safe_name"])
+    if not os.path.isdir(url_dir):
+        return min_interval
+    ensure_history(url_dir)
+    times = []
+    for record in read_history_tail(url_dir, 20):
+        try:
+            times.append(datetime.strptime(record["timestamp"], VERSION_TIMESTAMP_FORMAT))
+        except ValueError:
             continue
-        
-        safe_name = get_safe_filename_from_url(target_url)
-        if not safe_name:
-            print(f"::warning::无法为 URL '{target_url}' 生成文件夹名，已跳过。")
+    gaps = sorted((later - earlier).total_seconds() for earlier, later in zip(times, times[1:]))
+    if not gaps:
+        return min_interval
+    median_gap = gaps[len(gaps) // 2]
+    return min(max(median_gap / 2, min_interval), float(adaptive["max_interval_seconds"]))
+
+def get_adaptive_interval(job, schedule_state, adaptive):
+    """获取目标当前的自适应轮询间隔, 没有记录时根据历史估算"""
+    entry = schedule_state.get(job["safe_name"])
+    if entry and entry.get("interval"):
+        return float(entry["interval"])
+    return estimate_interval_from_history(job, adaptive)
+
+def select_due_jobs(jobs, schedule_state, adaptive, now):
+    """挑选本次运行到期的目标; 超出请求预算时优先检查逾期最久 (相对于间隔) 的目标"""
+    due = []
+    for job in jobs:
+        entry = schedule_state.get(job["safe_name"]) or {}
+        interval = get_adaptive_interval(job, schedule_state, adaptive)
+        last_checked = entry.get("last_checked")
+        if last_checked is None:
+            due.append((float("inf"), job))
+        elif now - last_checked + ADAPTIVE_SLACK_SECONDS >= interval:
+            due.append(((now - last_checked) / interval, job))
+    budget = int(adaptive.get("max_requests_per_run") or 0)
+    if budget and len(due) > budget:
+        due.sort(key=lambda item: (-item[0], item[1]["seq"]))
+        print(f"::notice::本次运行有 {len(due)} 个目标到期，受请求预算限制只检查其中 {budget} 个。")
+        due = due[:budget]
+    selected = sorted((job for _, job in due), key=lambda job: job["seq"])
+    skipped = len(jobs) - len(selected)
+    if skipped:
+        print(f"::notice::自适应轮询: 本次检查 {len(selected)} 个目标，跳过 {skipped} 个目标。")
+    return selected
+
+def update_adaptive_state(jobs, outcomes, schedule_state, adaptive, now):
+    """根据检查结果调整轮询间隔: 发生变化时立即收紧到最短间隔, 无变化时按指数退避放宽; 被跳过的目标保持原状态, 下次优先检查"""
+    for job in jobs:
+        outcome = outcomes.get(job["safe_name"])
+        if outcome is None or outcome == "skipped":
             continue
+        interval = get_adaptive_interval(job, schedule_state, adaptive)
+        if outcome == "changed":
+            interval = get_min_interval(job, adaptive)
+        elif outcome == "unchanged":
+            interval = min(interval * float(adaptive["backoff_factor"]), float(adaptive["max_interval_seconds"]))
+        schedule_state[job["safe_name"]] = {"interval": interval, "last_checked": now}
 
-        display_name = name or target_url
-        print(f"正在检查 '{display_name}'...")
-        url_dir = os.path.join(SNAPSHOT_DIR, safe_name)
-        if not os.path.exists(url_dir):
-            os.makedirs(url_dir)
+def get_job_schedule(job, settings):
+    """获取目标的轮询间隔与随机抖动 (秒), 目标配置优先于全局配置"""
+    target = job["target"]
+    interval = float(target.get("interval", settings.get("default_interval_seconds", DEFAULT_INTERVAL_SECONDS)))
+    jitter = float(target.get("jitter", settings.get("interval_jitter_seconds", 0)))
+    return max(1.0, interval), max(0.0, jitter)
 
-        latest_hash_file = os.path.join(url_dir, "latest.hash")
-        current_hash = get_content_hash(content)
-        last_hash = None
-        if os.path.exists(latest_hash_file):
-            with open(latest_hash_file, "r", encoding="utf-8") as f:
-                last_hash = f.read().strip()
-
-        # 检查是否需要发送错误通知
-        should_notify_error = False
-        if is_error and status_code and notify_status_codes and status_code in notify_status_codes:
-            should_notify_error = True
-            print(f"::notice title=需要提醒的错误::{display_name} 遇到需要提醒的HTTP状态码 {status_code}，将发送通知")
-
-        # 只有当内容发生变化时才处理（包括需要提醒的错误）
-        if current_hash != last_hash:
-            print(f"::notice title=检测到变化::{display_name}")
-            now = datetime.now(CST_TZ)
-            timestamp_str = now.strftime("%Y%m%d_%H%M%S")
-            change_dir = os.path.join(url_dir, timestamp_str)
-            os.makedirs(change_dir)
-
-            if is_error: snapshot_filename = "error.txt"
-            elif type == "url": snapshot_filename = "snapshot.html"
-            else: snapshot_filename = "response.txt"
-
-            new_snapshot_file = os.path.join(change_dir, snapshot_filename)
-            with open(new_snapshot_file, "wb") as f:
-                f.write(content)
-
-            diff_report_content = "新目标，无历史版本可比较。"
-            if last_hash:
-                history_dirs = sorted([d for d in os.listdir(url_dir) if os.path.isdir(os.path.join(url_dir, d)) and d != timestamp_str])
-                if history_dirs:
-                    last_snapshot_dir = os.path.join(url_dir, history_dirs[-1])
-                    last_snapshot_path = None
-                    possible_filenames = ["snapshot.html", "response.txt", "error.txt"]
-                    for f_name in os.listdir(last_snapshot_dir):
-                        if f_name in possible_filenames:
-                            last_snapshot_path = os.path.join(last_snapshot_dir, f_name)
-                            break
-                    if last_snapshot_path and os.path.exists(last_snapshot_path):
-                        with open(last_snapshot_path, "r", encoding='utf-8', errors='ignore') as f_old, \
-                             open(new_snapshot_file, "r", encoding='utf-8', errors='ignore') as f_new:
-                            old_lines, new_lines = f_old.readlines(), f_new.readlines()
-                        diff = difflib.unified_diff(old_lines, new_lines, fromfile='old', tofile='new', lineterm='')
-                        diff_report_content = '\n'.join(diff)
-
-            diff_report_file = os.path.join(change_dir, "diff.txt")
-            with open(diff_report_file, "w", encoding="utf-8") as f:
-                f.write(diff_report_content)
-
-            with open(latest_hash_file, "w", encoding="utf-8") as f:
-                f.write(current_hash)
-
-            snapshot_url = ""
-            if repo_full_name:
-                snapshot_url = f"https://github.com/{repo_full_name}/tree/main/{change_dir.replace(os.sep, '/')}"
-
-            diff_lines = diff_report_content.split('\n')
-            truncated_diff = '\n'.join(diff_lines[:MAX_DIFF_LINES])
-            if len(diff_lines) > MAX_DIFF_LINES:
-                truncated_diff += "\n... (内容已截断，请查看快照链接获取完整差异)"
-
-            # 只有当需要提醒的错误或者不是错误状态时才添加到变更列表
-            if should_notify_error or not is_error:
-                all_changes.append({
-                    "name": name, "url": target_url,
-                    "timestamp": now.strftime('%Y-%m-%d %H:%M:%S %Z'),
-                    "snapshot_url": snapshot_url, "diff": truncated_diff
-                })
-        elif is_error:
-            # 遇到不需要提醒的错误时，不更新最新哈希值，保持上次正常状态
-            print(f"::notice::{display_name} 遇到不需要提醒的错误，保持上次正常状态")
+def get_job_key(job):
+    """守护进程中用于跨配置重载识别同一目标的键"""
+    return job["safe_name"], job["type"], job["command"] or job["url"]
+
+def run_daemon(stop_event=None):
+    """常驻模式: 按各目标的轮询间隔调度检查, 每个目标完成后立即处理并重新排队, 慢主机不会拖住其他目标;
+    发现变更立即保存并通知, 配置文件修改后等进行中的目标完成再重新加载"""
+    stop_event = stop_event or threading.Event()
+    repo_full_name = prepare_run()
+    jobs_by_key, settings = {}, {}
+    schedule_state = load_state(SCHEDULE_STATE_FILE)
+    breaker_state = load_state(BREAKER_STATE_FILE)
+    dispatcher = NotificationDispatcher()
+    schedule = []
+    generation = 0
+    config_mtime = None
+    # 已交给抓取引擎、尚未处理完成的目标
+    running = {}
+    pending_changes = []
+    metrics = RunMetrics()
+    # Prometheus 文本文件中各目标的最近一次记录, 每次导出都写出全部目标
+    exported = {}
+    last_flush = time.monotonic()
+    adaptive, breaker = None, None
+    print(f"::notice::守护进程模式已启动，配置文件: {CONFIG_FILE}")
+
+    def reschedule(job):
+        """目标处理完成后按轮询间隔重新排队"""
+        interval, jitter = get_job_schedule(job, settings)
+        if adaptive:
+            interval = get_adaptive_interval(job, schedule_state, adaptive)
+        due = time.monotonic() + interval + random.uniform(-jitter, jitter)
+        heapq.heappush(schedule, (due, job["seq"], get_job_key(job), generation))
+
+    def flush(force=False):
+        """立即提交新的变更通知; 指标与状态文件至多每 DAEMON_CONFIG_CHECK_SECONDS 秒写入一次"""
+        nonlocal metrics, last_flush
+        if pending_changes:
+            dispatcher.submit(list(pending_changes))
+            pending_changes.clear()
+        if not force and time.monotonic() - last_flush < DAEMON_CONFIG_CHECK_SECONDS:
+            return
+        last_flush = time.monotonic()
+        if metrics.targets:
+            export_metrics(metrics, settings, exported)
+            metrics = RunMetrics()
+        try:
+            if breaker:
+                save_state(BREAKER_STATE_FILE, breaker_state)
+            if adaptive:
+                save_state(SCHEDULE_STATE_FILE, schedule_state)
+        except OSError as e:
+            print(f"::warning::保存守护进程状态失败: {e}")
+
+    def take_due_jobs():
+        """抓取引擎的任务来源: 取出已到期的目标; 需要停止或配置文件已修改时返回 None"""
+        try:
+            config_changed = os.path.getmtime(CONFIG_FILE) != config_mtime
+        except OSError:
+            config_changed = False
+        if stop_event.is_set() or config_changed:
+            return None
+        flush()
+        now = time.monotonic()
+        due_jobs = []
+        while schedule and schedule[0][0] <= now:
+            _, _, key, entry_generation = heapq.heappop(schedule)
+            if entry_generation == generation and key in jobs_by_key:
+                running[key] = jobs_by_key[key]
+                due_jobs.append(jobs_by_key[key])
+        wait_seconds = DAEMON_CONFIG_CHECK_SECONDS
+        if schedule:
+            wait_seconds = min(wait_seconds, max(0.0, schedule[0][0] - time.monotonic()))
+        return sorted(due_jobs, key=lambda job: job["seq"]), wait_seconds
+
+    def handle_result(job, fetched):
+        """处理单个目标的抓取结果并重新排队; 出错时只记录错误, 不影响其他目标"""
+        running.pop(get_job_key(job), None)
+        if fetched.get("returned"):
+            # 引擎停止前尚未开始的目标保持到期状态, 重新启动后立即检查
+            heapq.heappush(schedule, (time.monotonic(), job["seq"], get_job_key(job), generation))
+            return
+        try:
+            outcome, change = process_fetch_result(job, fetched, settings, repo_full_name)
+            metrics.record_target(job, fetched, outcome)
+            if change:
+                pending_changes.append(change)
+            if adaptive:
+                update_adaptive_state([job], {job["safe_name"]: outcome}, schedule_state, adaptive, time.time())
+        except Exception as e:
+            print(f"::error::处理 '{job['name'] or job['url']}' 的检查结果时出错，将按轮询间隔重新调度: {e}")
+        reschedule(job)
+
+    try:
+        while not stop_event.is_set():
+            try:
+                mtime = os.path.getmtime(CONFIG_FILE)
+            except OSError:
+                mtime = config_mtime
+            # 首次加载失败时与单次运行一致, 报错退出; 之后加载失败则继续使用当前配置
+            if mtime != config_mtime or not generation:
+                try:
+                    targets, new_settings = load_config()
+                except FileNotFoundError:
+                    if not generation:
+                        print(f"::error::错误: 未找到配置文件 {CONFIG_FILE}。")
+                        sys.exit(1)
+                    print(f"::error::未找到配置文件 {CONFIG_FILE}，继续使用当前配置。")
+                except (OSError, yaml.YAMLError) as e:
+                    if not generation:
+                        print(f"::error::错误: 配置文件 {CONFIG_FILE} 格式不正确: {e}")
+                        sys.exit(1)
+                    print(f"::error::重新加载配置文件失败，继续使用当前配置: {e}")
+                else:
+                    settings = new_settings
+                    dispatcher.coalesce_seconds = float(settings.get("notification_coalesce_seconds", 0) or 0)
+                    previous_due = {entry[2]: entry[0] for entry in schedule if entry[3] == generation}
+                    generation += 1
+                    jobs_by_key = {get_job_key(job): job for job in build_fetch_jobs(targets, settings)}
+                    # 已从配置中删除的目标不再导出
+                    safe_names = {job["safe_name"] for job in jobs_by_key.values()}
+                    for safe_name in set(exported.get("targets", {})) - safe_names:
+                        del exported["targets"][safe_name]
+                    now = time.monotonic()
+                    schedule = []
+                    adaptive = get_adaptive_settings(settings)
+                    for key, job in jobs_by_key.items():
+                        # 已在调度中的目标保留原定时间; 新目标立即检查, 启用自适应轮询时按上次检查时间顺延
+                        due = previous_due.get(key, now)
+                        entry = schedule_state.get(job["safe_name"]) or {}
+                        if key not in previous_due and adaptive and entry.get("last_checked"):
+                            remaining = get_adaptive_interval(job, schedule_state, adaptive) - (time.time() - entry["last_checked"])
+                            due = now + max(0.0, remaining)
+                        heapq.heappush(schedule, (due, job["seq"], key, generation))
+                    print(f"::notice::已加载配置，共 {len(jobs_by_key)} 个监控目标。")
+                config_mtime = mtime
+
+            if not schedule:
+                stop_event.wait(DAEMON_CONFIG_CHECK_SECONDS)
+                continue
+            # 抓取引擎持续运行, 直到需要停止或重新加载配置; 其间每个目标完成后立即处理并重新排队
+            adaptive = get_adaptive_settings(settings)
+            breaker = get_circuit_breaker(settings, breaker_state)
+            try:
+                for job, fetched in run_fetch_jobs([], settings, breaker, feed=take_due_jobs):
+                    handle_result(job, fetched)
+            except Exception as e:
+                print(f"::error::抓取目标时出错，{len(running)} 个进行中的目标将按轮询间隔重新调度: {e}")
+                stop_event.wait(1)
+            for job in running.values():
+                reschedule(job)
+            running.clear()
+            flush(force=True)
+    finally:
+        dispatcher.close()
+    print("::notice::守护进程已停止。")
+
+def resolve_target_dir(target):
+    """根据目标名称、URL 或快照目录名找到目标的快照目录"""
+    candidates = [target, get_safe_filename_from_url(target)]
+    try:
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            targets = (yaml.safe_load(f) or {}).get("targets", []) or []
+    except (OSError, yaml.YAMLError):
+        targets = []
+    for item in targets:
+        if item.get("name") == target:
+            url = item.get("value") if item.get("type") == "url" else extract_url_from_curl(item.get("command") or "")
+            candidates.append(get_safe_filename_from_url(url))
+    for candidate in candidates:
+        if candidate and os.path.isdir(os.path.join(SNAPSHOT_DIR, candidate)):
+            return os.path.join(SNAPSHOT_DIR, candidate)
+    return None
+
+def parse_history_time(value):
+    """将 'YYYY-MM-DD HH:MM[:SS]' 或版本目录格式的时间转换为版本目录时间戳"""
+    for fmt in (VERSION_TIMESTAMP_FORMAT, "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).strftime(VERSION_TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的时间格式: {value}")
+
+def show_history(target, at=None, limit=20, show_content=False):
+    """查询目标的版本历史, 无需遍历快照目录"""
+    url_dir = resolve_target_dir(target)
+    if not url_dir:
+        print(f"::error::未找到目标 '{target}' 的快照目录。")
+        sys.exit(1)
+    ensure_history(url_dir)
+    if at:
+        try:
+            record = find_history_at(url_dir, parse_history_time(at))
+        except ValueError as e:
+            print(f"::error::{e}")
+            sys.exit(1)
+        records = [record] if record else []
+    else:
+        records = read_history_tail(url_dir, limit)
+    if not records:
+        print("没有符合条件的历史版本。")
+        return
+    for record in records:
+        status = record.get("status_code") or "-"
+        print(f"{record['timestamp']}  {record['kind']:<14} {status!s:<4} {record['size']:>10}  {record['hash'][:12]}  {record['path']}")
+    if show_content:
+        content = read_history_content(records[-1])
+        if content is None:
+            print(f"::warning::快照文件 {records[-1]['path']} 不存在。")
         else:
-            print(f"::notice title=无变化::{display_name}")
-
-    if all_changes:
-        summary_parts = []
-        for change in all_changes:
-            display_name = f"{change['name']} ({change['url']})" if change.get('name') else change['url']
-            part = (f"监控目标: {display_name}\n变更时间: {change['timestamp']}\n查看快照: {change['snapshot_url']}\n\n变更内容:\n---\n{change['diff']}\n---")
-            summary_parts.append(part)
-        
-        summary_for_webhook = "\n\n".join(summary_parts)
-        now_for_notification = datetime.now(CST_TZ)
-        now_str = now_for_notification.strftime('%Y-%m-%d %H:%M:%S %Z')
-        
-        print("\n--- 变更摘要 ---")
-        print(summary_for_webhook)
-        
-        webhook_urls = os.environ.get("WEBHOOK_URL")
-        send_webhook_notification(webhook_urls, now_str, summary_for_webhook)
-        
-        recipients = []
-        mail_recipients_var = os.environ.get("MAIL_RECIPIENTS")
-        if mail_recipients_var:
-            recipients.extend([email.strip() for email in mail_recipients_var.split(',') if email.strip()])
-        unique_recipients = sorted(list(set(recipients)))
+            sys.stdout.write(content.decode('utf-8', errors='replace'))
 
-        email_subject = f"网页/API 变更监控提醒 ({now_str})"
-        send_email_notification(email_subject, all_changes, unique_recipients)
-        
-        now_for_commit = now_for_notification.strftime('%Y-%m-%d %H:%M')
-        commit_message = f"【自动监控】内容发生变化 ({now_for_commit})"
-        if 'GITHUB_OUTPUT' in os.environ:
-            with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
-                f.write('changes_detected=true\n')
-                f.write(f'commit_message={commit_message}\n')
+def load_settings():
+    """仅读取配置文件中的全局配置, 供辅助命令使用"""
+    try:
+        with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+            return (yaml.safe_load(f) or {}).get("settings", {}) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
 
-if __name__ == "__main__":
-    if len(sys.argv) > 1 and sys.argv[1] == '--send-notification':
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="网页/API 变更监控")
+    parser.add_argument("--send-notification", action="store_true", help="发送由环境变量 NOTIFICATION_TITLE / NOTIFICATION_BODY 指定的自定义通知")
+    parser.add_argument("--migrate-snapshots", action="store_true", help="将旧版快照目录原地迁移为内容寻址的压缩对象存储")
+    parser.add_argument("--daemon", action="store_true", help="以常驻模式运行, 按各目标的 interval 轮询并在配置修改后自动重新加载")
+    parser.add_argument("--history", metavar="TARGET", help="查询目标 (名称、URL 或快照目录名) 的版本历史")
+    parser.add_argument("--at", metavar="TIME", help="与 --history 配合, 查询指定时间点生效的版本, 如 '2025-08-01 17:00'")
+    parser.add_argument("--limit", type=int, default=20, help="与 --history 配合, 显示最近的版本数量 (默认 20)")
+    parser.add_argument("--show", action="store_true", help="与 --history 配合, 输出最后一个版本的快照内容")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N", help="只检查第 I 个分片 (从 0 开始, 共 N 个) 的目标, 结果写入结果包而不发送通知")
+    parser.add_argument("--bundle-dir", default="bundle", help="与 --shard 配合, 结果包的输出目录 (默认 bundle)")
+    parser.add_argument("--merge", nargs="+", metavar="BUNDLE_DIR", help="合并各分片的结果包, 统一更新快照、发送通知并输出提交信息")
+    parser.add_argument("--profile", nargs="?", const="monitor.prof", metavar="FILE", help="使用 cProfile 分析本次运行, 结果保存到 FILE (默认 monitor.prof) 并输出最耗时的函数")
+    return parser.parse_args(argv)
+
+def run_command(args):
+    """按命令行参数执行对应的功能"""
+    if args.send_notification:
         title = os.environ.get("NOTIFICATION_TITLE")
         body = os.environ.get("NOTIFICATION_BODY")
         send_manual_notification(title, body)
+    elif args.migrate_snapshots:
+        migrate_snapshots(get_compression(load_settings()))
+    elif args.history:
+        show_history(args.history, args.at, args.limit, args.show)
+    elif args.merge:
+        merge_shard_bundles(args.merge)
+    elif args.daemon:
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        try:
+            run_daemon(stop_event)
+        except KeyboardInterrupt:
+            pass
+    else:
+        main(args.shard, args.bundle_dir)
+
+def run_profiled(args):
+    """在 cProfile 下执行命令; 抓取工作线程中的耗时不在主线程的统计中, 可结合运行指标中的阶段耗时分析"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run_command, args)
+    finally:
+        profiler.dump_stats(args.profile)
+        print(f"\n--- cProfile: 累计耗时最多的 {PROFILE_TOP_FUNCTIONS} 个函数 (完整结果已保存到 {args.profile}) ---")
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.profile:
+        run_profiled(args)
     else:
-        main()
+        run_command(args)
@@ -0,0 +1,172 @@
+"""本地通知接收端: 一个假的 Webhook 服务器与一个 SMTP 调试服务器, 用于在不发送真实通知的情况下测试通知流程
+
+用法:
+    python notification_sink.py --webhook-port 8025 --smtp-port 1025
+然后以如下环境变量运行 monitor.py:
+    WEBHOOK_URL=http://127.0.0.1:8025/hook
+    SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_SECURITY=none SMTP_USER=test SMTP_PASSWORD=test
+    MAIL_FROM=monitor@example.com MAIL_RECIPIENTS=a@example.com,b@example.com
+"""
+import argparse
+import json
+import os
+import random
+import socketserver
+import threading
+import time
+from datetime import datetime
+from email import message_from_bytes, policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SinkRecorder:
+    """在控制台打印收到的通知, 并可选地以 JSON Lines 追加写入文件"""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.lock = threading.Lock()
+
+    def record(self, kind, data):
+        entry = {"kind": kind, "received_at": datetime.now().isoformat(timespec="seconds"), **data}
+        with self.lock:
+            print(json.dumps(entry, ensure_ascii=False, indent=2), flush=True)
+            if self.output:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def make_webhook_handler(recorder, delay, failure_rate):
+    """创建假 Webhook 的请求处理类: 可模拟响应延迟与按比例返回 503"""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if delay:
+                time.sleep(delay)
+            if random.random() < failure_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = body.decode("utf-8", errors="replace")
+            recorder.record("webhook", {"path": self.path, "payload": payload})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"errcode": 0}')
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+def make_smtp_handler(recorder):
+    """创建 SMTP 调试服务器的会话处理类: 接受任意认证信息, 只记录邮件而不投递"""
+
+    class SMTPHandler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(f"{line}\r\n".encode("utf-8"))
+
+        def handle(self):
+            mail_from, recipients = None, []
+            self.reply("220 notification-sink ESMTP")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode("utf-8", errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    self.wfile.write(b"250-notification-sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif verb == "HELO":
+                    self.reply("250 notification-sink")
+                elif verb == "AUTH":
+                    # 按认证机制读取剩余的认证数据, 内容不做校验
+                    parts = command.split()
+                    mechanism = parts[1].upper() if len(parts) > 1 else ""
+                    prompts = {"PLAIN": 1, "LOGIN": 2}.get(mechanism, 0) - (1 if len(parts) > 2 else 0)
+                    for _ in range(max(0, prompts)):
+                        self.reply("334 ")
+                        self.rfile.readline()
+                    self.reply("235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    mail_from, recipients = command.split(":", 1)[1].strip(), []
+                    self.reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[1].strip())
+                    self.reply("250 OK")
+                elif verb == "DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    lines = []
+                    while True:
+                        data_line = self.rfile.readline()
+                        if not data_line or data_line in (b".\r\n", b".\n"):
+                            break
+                        lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                    message = message_from_bytes(b"".join(lines), policy=policy.default)
+                    plain = message.get_body(preferencelist=("plain",))
+                    recorder.record("email", {
+                        "mail_from": mail_from, "recipients": recipients,
+                        "subject": str(message["Subject"]),
+                        "text": plain.get_content() if plain else "",
+                    })
+                    self.reply("250 OK: queued")
+                elif verb in ("RSET", "NOOP"):
+                    if verb == "RSET":
+                        mail_from, recipients = None, []
+                    self.reply("250 OK")
+                elif verb == "QUIT":
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("502 Command not implemented")
+
+    return SMTPHandler
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="本地通知接收端 (假 Webhook + SMTP 调试服务器)")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认 127.0.0.1)")
+    parser.add_argument("--webhook-port", type=int, default=8025, help="假 Webhook 端口, 0 表示不启动 (默认 8025)")
+    parser.add_argument("--smtp-port", type=int, default=1025, help="SMTP 调试服务器端口, 0 表示不启动 (默认 1025)")
+    parser.add_argument("--webhook-delay", type=float, default=0.0, help="Webhook 响应前的延迟 (秒), 用于模拟响应缓慢的地址")
+    parser.add_argument("--webhook-failure-rate", type=float, default=0.0, help="Webhook 返回 503 的比例 (0~1), 用于验证重试")
+    parser.add_argument("--output", help="将收到的通知以 JSON Lines 追加写入该文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    recorder = SinkRecorder(os.path.abspath(args.output) if args.output else None)
+    servers = []
+    if args.webhook_port:
+        handler = make_webhook_handler(recorder, args.webhook_delay, args.webhook_failure_rate)
+        servers.append(ThreadingHTTPServer((args.host, args.webhook_port), handler))
+        print(f"假 Webhook 已启动: http://{args.host}:{args.webhook_port}/", flush=True)
+    if args.smtp_port:
+        servers.append(ThreadingTCPServer((args.host, args.smtp_port), make_smtp_handler(recorder)))
+        print(f"SMTP 调试服务器已启动: {args.host}:{args.smtp_port} (SMTP_SECURITY=none)", flush=True)
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
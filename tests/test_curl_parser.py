@@ -0,0 +1,99 @@
+import pytest
+
+import monitor
+
+
+def parse(command):
+    request, reason = monitor.parse_curl_command(command)
+    assert reason is None, reason
+    return request
+
+
+def test_simple_get():
+    request = parse("curl -s 'https://example.com/api?a=1&b=2'")
+    assert request["method"] == "GET"
+    assert request["url"] == "https://example.com/api?a=1&b=2"
+    assert request["data"] is None
+    assert request["allow_redirects"] is False
+
+
+def test_line_continuations_and_combined_flags():
+    request = parse("curl -sSL \\\n  -XPOST https://example.com \\\n  -H 'X-A: 1' \\\n  -d 'k=v'")
+    assert request["method"] == "POST"
+    assert request["allow_redirects"] is True
+    assert request["headers"]["X-A"] == "1"
+    assert request["data"] == b"k=v"
+    assert request["headers"]["Content-Type"] == "application/x-www-form-urlencoded"
+
+
+def test_header_removal_and_empty_header():
+    request = parse("curl https://example.com -H 'Accept:' -H 'X-Empty;'")
+    assert request["headers"]["Accept"] is None
+    assert request["headers"]["X-Empty"] == ""
+
+
+def test_get_moves_data_to_query():
+    request = parse("curl -G https://example.com/s?q=1 --data-urlencode 'w=a b'")
+    assert request["url"] == "https://example.com/s?q=1&w=a+b"
+    assert request["data"] is None
+
+
+def test_json_sets_headers():
+    request = parse("""curl https://example.com --json '{"a": 1}'""")
+    assert request["headers"]["Content-Type"] == "application/json"
+    assert request["headers"]["Accept"] == "application/json"
+    assert request["data"] == b'{"a": 1}'
+
+
+def test_cookies_auth_and_timeout():
+    request = parse("curl -b 'a=1' -b 'b=2' -u user:pass -m 5 -k https://example.com")
+    assert request["headers"]["Cookie"] == "a=1; b=2"
+    assert request["auth"] == ("user", "pass")
+    assert request["timeout"] == 5.0
+    assert request["verify"] is False
+
+
+@pytest.mark.parametrize("command", [
+    "curl -H 'X-Name: 中文' https://example.com",
+    "curl -b 'name=中文' https://example.com",
+    "curl -A '浏览器' https://example.com",
+    "curl -u '用户:pass' https://example.com",
+])
+def test_non_latin1_values_fall_back_to_subprocess(command):
+    request, reason = monitor.parse_curl_command(command)
+    assert request is None and reason
+
+
+def test_latin1_header_values_stay_in_process():
+    assert parse("curl -H 'X-Name: café' https://example.com")["headers"]["X-Name"] == "café"
+
+
+@pytest.mark.parametrize("command", [
+    "curl https://example.com | grep a",
+    "curl https://example.com > out.txt",
+    "curl https://a.com; curl https://b.com",
+    "curl https://example.com && echo ok",
+    "curl -H \"X-Token: $TOKEN\" https://example.com",
+    "curl https://example.com/`date`",
+    "curl -d @body.json https://example.com",
+    "curl -b cookies.txt https://example.com",
+    "curl --unknown-option https://example.com",
+    "curl https://a.com https://b.com",
+    "wget https://example.com",
+    "curl 'https://example.com",
+])
+def test_unsupported_commands_fall_back(command):
+    request, reason = monitor.parse_curl_command(command)
+    assert request is None and reason
+
+
+def test_hash_inside_word_is_literal():
+    request = parse("curl https://x.com/app/#/route -H 'X-A: 1'")
+    assert request["url"] == "https://x.com/app/#/route"
+    assert request["headers"]["X-A"] == "1"
+    assert parse("curl https://x.com -H X-Tag:#1")["headers"]["X-Tag"] == "#1"
+
+
+def test_comment_falls_back():
+    request, reason = monitor.parse_curl_command("curl https://x.com # -H 'X-A: 1'")
+    assert request is None and reason
@@ -0,0 +1,21 @@
+import threading
+
+import pytest
+
+import monitor
+
+
+@pytest.mark.parametrize("content", [None, "targets: [\n"])
+def test_daemon_exits_when_first_config_load_fails(tmp_path, monkeypatch, content):
+    monkeypatch.chdir(tmp_path)
+    if content is not None:
+        (tmp_path / monitor.CONFIG_FILE).write_text(content, encoding="utf-8")
+    stop_event = threading.Event()
+    timer = threading.Timer(5, stop_event.set)
+    timer.start()
+    try:
+        with pytest.raises(SystemExit) as excinfo:
+            monitor.run_daemon(stop_event)
+    finally:
+        timer.cancel()
+    assert excinfo.value.code == 1
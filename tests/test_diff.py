@@ -0,0 +1,102 @@
+import difflib
+import os
+import random
+
+import pytest
+
+import monitor
+
+
+def random_lines(rng, count, alphabet="abcdef"):
+    return [rng.choice(alphabet) * rng.randint(1, 3) for _ in range(count)]
+
+
+def mutate(rng, lines):
+    lines = list(lines)
+    for _ in range(rng.randint(0, 6)):
+        op = rng.choice(["insert", "delete", "replace"])
+        pos = rng.randint(0, len(lines))
+        if op == "insert":
+            lines[pos:pos] = random_lines(rng, rng.randint(1, 4))
+        elif lines:
+            end = min(len(lines), pos + rng.randint(1, 4))
+            lines[pos:end] = [] if op == "delete" else random_lines(rng, rng.randint(1, 4))
+    return lines
+
+
+def apply_opcodes(a, b, opcodes):
+    """按操作序列从 a 重建 b, 同时检查操作连续且覆盖两侧全部内容"""
+    result, i, j = [], 0, 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            result.extend(a[i1:i2])
+        else:
+            assert tag in ("delete", "insert", "replace")
+            result.extend(b[j1:j2])
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return result
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_opcodes_rebuild_b_from_a(seed):
+    rng = random.Random(seed)
+    a = random_lines(rng, rng.randint(0, 40))
+    b = mutate(rng, a) if rng.random() < 0.8 else random_lines(rng, rng.randint(0, 40))
+    opcodes = list(monitor.iter_opcodes(a, b))
+    assert apply_opcodes(a, b, opcodes) == b
+    # 相邻的操作已合并
+    assert all(x[0] != y[0] for x, y in zip(opcodes, opcodes[1:]))
+
+
+def test_opcodes_over_time_budget_still_rebuild_b():
+    rng = random.Random(1)
+    a = random_lines(rng, 500)
+    b = mutate(rng, a)
+    assert apply_opcodes(a, b, list(monitor.iter_opcodes(a, b, time_budget=0))) == b
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_grouping_matches_difflib(seed):
+    rng = random.Random(seed)
+    a = random_lines(rng, rng.randint(1, 60))
+    b = mutate(rng, a)
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    expected = [list(group) for group in matcher.get_grouped_opcodes(monitor.DIFF_CONTEXT_LINES)]
+    opcodes = [op for op in matcher.get_opcodes() if not (op[0] == "equal" and op[1] == op[2])]
+    assert list(monitor._group_opcodes(opcodes)) == expected
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_unified_diff_matches_difflib_for_unambiguous_edits(seed):
+    rng = random.Random(seed)
+    # 每行唯一时差异结果没有歧义, 两种算法的输出应完全一致
+    a = [f"line {i}" for i in range(rng.randint(5, 80))]
+    b = list(a)
+    for _ in range(rng.randint(1, 4)):
+        pos = rng.randrange(len(b) + 1)
+        choice = rng.random()
+        if choice < 0.4:
+            b.insert(pos, f"new {seed} {pos} {rng.random()}")
+        elif choice < 0.7 and pos < len(b):
+            del b[pos]
+        elif pos < len(b):
+            b[pos] = f"changed {seed} {pos} {rng.random()}"
+    old, new = ("\n".join(a) + "\n").encode(), ("\n".join(b) + "\n").encode()
+    expected = list(difflib.unified_diff(a, b, "old", "new", lineterm=""))
+    assert list(monitor.iter_unified_diff(old, new)) == expected
+
+
+def test_write_diff_report_preview_and_full_file(tmp_path):
+    path = os.path.join(tmp_path, "diff.txt")
+    lines = [f"line {i}" for i in range(100)]
+    preview = monitor.write_diff_report(path, iter(lines), preview_lines=10)
+    assert preview.split("\n")[:10] == lines[:10]
+    assert "已截断" in preview
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "\n".join(lines)
+    assert monitor.write_diff_report(path, ["a", "b"], preview_lines=2) == "a\nb"
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "a\nb"
@@ -0,0 +1,45 @@
+import threading
+import time
+
+import monitor
+
+
+def make_job(seq, host="probe.example.com"):
+    url = f"http://{host}/{seq}"
+    return {"seq": seq, "name": None, "type": "url", "url": url, "host": host, "safe_name": f"job{seq}"}
+
+
+def run_jobs(jobs, settings, breaker, timeout=10):
+    """在线程中运行抓取引擎, 超时未结束视为卡死"""
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(monitor.run_fetch_jobs(jobs, settings, breaker)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "run_fetch_jobs 没有结束"
+    return results
+
+
+def test_probe_with_unexpected_error_reopens_breaker(monkeypatch):
+    host = "probe.example.com"
+    state = {host: {"failures": 3, "opened_at": time.time() - 3600}}
+    breaker = monitor.CircuitBreaker(state, failure_threshold=3, cooldown_seconds=600)
+
+    def fetch_job(job, timings=None):
+        raise OSError("unexpected")
+
+    monkeypatch.setattr(monitor, "fetch_job", fetch_job)
+    jobs = [make_job(seq) for seq in range(3)]
+    results = run_jobs(jobs, {"max_per_host": 1, "retry_count": 1}, breaker)
+
+    assert sorted(job["seq"] for job, _ in results) == [0, 1, 2]
+    assert all(fetched.get("skipped") for _, fetched in results)
+    assert host not in breaker.probing
+    assert state[host]["opened_at"] > time.time() - 60
+
+
+def test_unexpected_error_without_probe_does_not_count_as_failure(monkeypatch):
+    breaker = monitor.CircuitBreaker({}, failure_threshold=1, cooldown_seconds=600)
+    monkeypatch.setattr(monitor, "fetch_job", lambda job, timings=None: (_ for _ in ()).throw(ValueError("bug")))
+    results = run_jobs([make_job(0)], {"retry_count": 1}, breaker)
+    assert results[0][1].get("skipped")
+    assert breaker.state == {}
@@ -0,0 +1,56 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import monitor
+
+
+def make_history(tmp_path, rng, count):
+    """写入 count 条按时间递增的版本记录 (允许同一秒内的多条), 返回记录列表"""
+    records = []
+    moment = datetime(2024, 1, 1)
+    for i in range(count):
+        moment += timedelta(seconds=rng.choice([0, 1, 60, 3600]))
+        record = monitor.build_history_record(
+            moment.strftime(monitor.VERSION_TIMESTAMP_FORMAT),
+            # 长短不一的记录, 使部分记录跨越读取时的 4096 字节块边界
+            {"kind": "snapshot.html", "hash": f"{i:064x}", "size": rng.randint(0, 10 ** 6),
+             "object": "objects/" + "x" * rng.randint(0, 3000) + str(i)},
+            f"target/{i}")
+        monitor.append_history(str(tmp_path), record)
+        records.append(record)
+    return records
+
+
+def linear_find(records, timestamp_str):
+    found = None
+    for record in records:
+        if record["timestamp"] <= timestamp_str:
+            found = record
+    return found
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_read_history_tail_matches_linear_scan(tmp_path, seed):
+    rng = random.Random(seed)
+    records = make_history(tmp_path, rng, rng.randint(0, 40))
+    for count in (1, 2, 3, 7, 50):
+        assert monitor.read_history_tail(str(tmp_path), count) == records[-count:]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_find_history_at_matches_linear_scan(tmp_path, seed):
+    rng = random.Random(seed)
+    records = make_history(tmp_path, rng, rng.randint(0, 40))
+    probes = ["20000101_000000", "20991231_235959"] + [record["timestamp"] for record in records]
+    for record in records:
+        moment = datetime.strptime(record["timestamp"], monitor.VERSION_TIMESTAMP_FORMAT)
+        probes += [(moment + timedelta(seconds=delta)).strftime(monitor.VERSION_TIMESTAMP_FORMAT) for delta in (-1, 1, 30)]
+    for probe in probes:
+        assert monitor.find_history_at(str(tmp_path), probe) == linear_find(records, probe)
+
+
+def test_missing_history(tmp_path):
+    assert monitor.read_history_tail(str(tmp_path)) == []
+    assert monitor.find_history_at(str(tmp_path), "20240101_000000") is None